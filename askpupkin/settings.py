@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -16,6 +17,8 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
+TESTING = sys.argv[1:2] == ['test']
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -29,6 +32,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'questions.staticfiles.StaticFilesMiddleware',
+    'questions.profiling.ProfilingMiddleware',
+    'questions.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,11 +44,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# 'askpupkin.async_urls' serves the listing and question pages with async
+# views; use it when running under an ASGI server.
 ROOT_URLCONF = 'askpupkin.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'questions.profiling.ProfilingDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'askpupkin', 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -101,6 +109,31 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'askpupkin', 'static'),
 ]
 
+# `manage.py collectstatic` writes content-hashed copies here, plus .gz (and
+# .br when the brotli package is installed) next to text assets.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'questions.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+if TESTING:
+    # Tests render pages with DEBUG off, where the manifest storage needs
+    # collectstatic to have run first.
+    STORAGES['staticfiles'] = {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}
+
+# Serve STATIC_ROOT from the app with far-future headers; on by default when
+# DEBUG is off. Leave it off if a web server serves STATIC_ROOT instead.
+STATIC_SERVE = not DEBUG
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -114,5 +147,76 @@ DATABASES = {
         'PASSWORD': 'admin',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
-}
\ No newline at end of file
+}
+
+# Read replicas of 'default'. Point HOST at a streaming replica in production;
+# locally it is the same server, so routing works without one.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['questions.routers.ReplicaRouter']
+# After a write a client reads from the primary for this long.
+REPLICA_STICKINESS_SECONDS = 5
+
+# Shared by every web process, worker and management command: invalidations
+# and counters kept here only work if they all see the same cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+
+if TESTING:
+    # Tests run in one process and need no Redis server.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'askpupkin-tests',
+        }
+    }
+
+# Sessions live in the cache; changes to an existing one reach the database
+# this much later (0 writes through). The run_jobs worker persists them from
+# the cache, so with a per-process cache (LocMemCache) they are written through.
+SESSION_ENGINE = 'questions.sessions'
+SESSION_WRITE_BEHIND_SECONDS = 30
+
+# Serves request.user from a cached snapshot, see questions.auth.
+AUTHENTICATION_BACKENDS = ['questions.auth.CachedUserBackend']
+
+# Run background jobs right after the write commits instead of queueing them
+# for `manage.py run_jobs`; handy when no worker is running.
+JOBS_EAGER = False
+
+# Requests slower than this are written, with their SQL, to slow_requests.log.
+PROFILING_SLOW_REQUEST_MS = 500
+PROFILING_SAMPLE_RATE = 1.0
+PROFILING_REPEATED_QUERY_THRESHOLD = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'slow_requests.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'questions.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,38 @@
+(function () {
+    var list = document.querySelector('.answers[data-live-url]');
+    if (!list || !window.EventSource) {
+        return;
+    }
+    // Only the first page shows new answers, so only it asks for them.
+    var showNew = list.hasAttribute('data-live-new');
+    var url = list.dataset.liveUrl;
+    if (showNew) {
+        var after = 0;
+        list.querySelectorAll('[data-answer-id]').forEach(function (item) {
+            after = Math.max(after, Number(item.dataset.answerId));
+        });
+        url += '?after=' + after;
+    }
+    var source = new EventSource(url);
+
+    source.addEventListener('answer', function (event) {
+        var data = JSON.parse(event.data);
+        if (!showNew || list.querySelector('[data-answer-id="' + data.id + '"]')) {
+            return;
+        }
+        var template = document.createElement('template');
+        template.innerHTML = data.html.trim();
+        list.insertBefore(template.content.firstChild, list.firstChild);
+    });
+
+    source.addEventListener('rating', function (event) {
+        var data = JSON.parse(event.data);
+        var selector = data.answer !== undefined
+            ? '[data-answer-id="' + data.answer + '"]'
+            : '[data-question-id="' + data.question + '"]';
+        var item = document.querySelector(selector);
+        if (item) {
+            item.querySelector('.vote-count').textContent = data.rating;
+        }
+    });
+})();
@@ -0,0 +1,41 @@
+(function () {
+    var input = document.querySelector('input[data-suggest-url]');
+    if (!input) {
+        return;
+    }
+    var list = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    var last = null;
+
+    function update() {
+        // Only the tag being typed, after the last comma, is completed.
+        var parts = input.value.split(',');
+        var term = parts.pop().trim();
+        var head = parts.map(function (part) { return part.trim(); }).filter(Boolean);
+        if (!term || term === last) {
+            return;
+        }
+        last = term;
+        fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(term), {credentials: 'same-origin'})
+            .then(function (response) {
+                return response.ok ? response.json() : null;
+            })
+            .then(function (data) {
+                if (!data || term !== last) {
+                    return;
+                }
+                list.innerHTML = '';
+                data.tags.forEach(function (tag) {
+                    var option = document.createElement('option');
+                    option.value = head.concat([tag.name]).join(', ');
+                    option.label = tag.name + ' (' + tag.count + ')';
+                    list.appendChild(option);
+                });
+            });
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(update, 150);
+    });
+})();
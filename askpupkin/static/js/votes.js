@@ -0,0 +1,33 @@
+document.addEventListener('click', function (event) {
+    var arrow = event.target.closest('.vote-arrow[data-vote-url]');
+    if (!arrow) {
+        return;
+    }
+    event.preventDefault();
+
+    // Only rendered for signed-in users; anonymous pages are cached whole.
+    var token = document.querySelector('meta[name="csrf-token"]');
+    if (!token) {
+        window.location.href = '/login/';
+        return;
+    }
+
+    var body = new FormData();
+    body.append('value', arrow.dataset.value);
+    fetch(arrow.dataset.voteUrl, {
+        method: 'POST',
+        body: body,
+        headers: {'X-CSRFToken': token.content},
+        credentials: 'same-origin'
+    }).then(function (response) {
+        if (response.status === 401) {
+            window.location.href = '/login/';
+            return null;
+        }
+        return response.ok ? response.json() : null;
+    }).then(function (data) {
+        if (data) {
+            arrow.parentElement.querySelector('.vote-count').textContent = data.rating;
+        }
+    });
+});
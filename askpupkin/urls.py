@@ -1,7 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from questions import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('questions.urls')),
 ]
+
+# In production the web server serves MEDIA_ROOT, with the same long-lived
+# headers on avatars/thumbs/ as views.media sets here.
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^media/(?P<path>.*)$', views.media, name='media'),
+    ]
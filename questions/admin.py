@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Tag, Question, Answer, QuestionLike, AnswerLike
+from .models import User, Tag, Question, Answer, QuestionLike, AnswerLike, Job
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -17,7 +17,7 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at', 'rating')
+    list_display = ('title', 'author', 'created_at', 'rating', 'answer_count')
     list_filter = ('created_at',)
     search_fields = ('title', 'text')
 
@@ -27,3 +27,8 @@ class AnswerAdmin(admin.ModelAdmin):
 
 admin.site.register(QuestionLike)
 admin.site.register(AnswerLike)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'name')
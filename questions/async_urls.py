@@ -0,0 +1,19 @@
+from django.urls import path
+from . import async_views, live
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'index': async_views.index,
+    'hot': async_views.hot,
+    'tag': async_views.tag,
+    'question': async_views.question,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
+
+# Streams hold their request open, so they are only served from here.
+urlpatterns.append(path('question/<int:question_id>/events/', live.question_events, name='question_events'))
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.urls import reverse
+from .models import Question, Answer, Tag
+from .sidebar import get_sidebar
+from .caching import (
+    cache_anonymous_page, conditional_page, hot_fingerprint, hot_version, pages_fingerprint, question_fingerprint,
+)
+from .views import paginate, paginate_questions, paginate_tag
+from . import related
+
+request_log = logging.getLogger('django.request')
+
+def _in_thread(func, *args):
+    # Each call gets its own worker thread and therefore its own connection,
+    # so independent queries really run at the same time.
+    def run():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def _render_head(request):
+    # Rendered without the request so the context processors (and the
+    # sidebar queries behind them) do not run before the page data is loaded.
+    user = request.user
+    return render_to_string('blocks/head.html', {
+        'user': user,
+        'csrf_token': get_token(request) if user.is_authenticated else '',
+    })
+
+
+async def _stream(request, template_name, load_context):
+    head = await sync_to_async(_render_head)(request)
+    # The head goes out before any query runs, so the browser can fetch CSS early.
+    yield head
+    try:
+        context = await load_context()
+        context['head_streamed'] = True
+        body = await sync_to_async(render_to_string)(template_name, context, request=request)
+    except Exception:
+        # The 200 and the head are already sent, so the error can only end
+        # the page; it is logged like any other server error.
+        request._stream_failed = True
+        request_log.error('Error while streaming %s', request.path, exc_info=True,
+                          extra={'status_code': 500, 'request': request})
+        body = await sync_to_async(render_to_string)('blocks/stream_error.html')
+    yield body
+
+
+def _stream_response(request, template_name, load_context):
+    return StreamingHttpResponse(_stream(request, template_name, load_context))
+
+
+async def _listing(request, load_page, args, extra):
+    async def load_context():
+        (page, page_range), sidebar = await asyncio.gather(
+            _in_thread(load_page, *args),
+            _in_thread(get_sidebar, request),
+        )
+        return {'page': page, 'page_range': page_range, **extra, **sidebar}
+    return _stream_response(request, 'pages/index.html', load_context)
+
+
+@conditional_page(pages_fingerprint)
+@cache_anonymous_page
+async def index(request):
+    args = (request, Question.NEW_ORDERING)
+    return await _listing(request, paginate_questions, args, {'title': 'New Questions'})
+
+
+@conditional_page(hot_fingerprint)
+@cache_anonymous_page(version=hot_version)
+async def hot(request):
+    args = (request, Question.HOT_ORDERING)
+    return await _listing(request, paginate_questions, args, {'title': 'Hot Questions'})
+
+
+@conditional_page(pages_fingerprint)
+@cache_anonymous_page
+async def tag(request, tag_name):
+    try:
+        tag_id = await Tag.objects.values_list('id', flat=True).aget(name=tag_name)
+    except Tag.DoesNotExist:
+        raise Http404('No Tag matches the given query.')
+    return await _listing(request, paginate_tag, (request, tag_id), {'tag_name': tag_name})
+
+
+@conditional_page(question_fingerprint)
+async def question(request, question_id):
+    if not await Question.objects.filter(pk=question_id).aexists():
+        raise Http404('No Question matches the given query.')
+
+    def load_question():
+        return Question.objects.select_related('author').prefetch_related('tags').get(pk=question_id)
+
+    async def load_context():
+        answers = Answer.objects.filter(question_id=question_id).select_related('author')
+        question_item, (page, page_range), related_questions, sidebar = await asyncio.gather(
+            _in_thread(load_question),
+            _in_thread(paginate, answers, request, Answer.ORDERING, f'answers:{question_id}', 5),
+            _in_thread(related.for_question, question_id),
+            _in_thread(get_sidebar, request),
+        )
+        return {
+            'question': question_item, 'answers': page, 'page_range': page_range, 'related': related_questions,
+            'live_url': reverse('question_events', kwargs={'question_id': question_id}), **sidebar,
+        }
+    return _stream_response(request, 'pages/question.html', load_context)
@@ -0,0 +1,51 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import User
+
+USER_KEY = 'user:{}'
+# Invalidation is explicit; the timeout only bounds how long a per-process
+# cache elsewhere can serve a stale copy.
+USER_TIMEOUT = 60 * 5
+# What the header and the settings page read from request.user. Anything
+# else is loaded from the database on first access.
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'first_name', 'email', 'avatar', 'avatar_small', 'avatar_large',
+    'is_active', 'is_staff', 'is_superuser',
+)
+
+
+def _snapshot(user):
+    fields = [field for field in User._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS]
+    return {
+        'names': [field.attname for field in fields],
+        'values': [field.get_prep_value(field.value_from_object(user)) for field in fields],
+        # Instead of the password hash, which stays out of the cache.
+        'session_auth_hash': user.get_session_auth_hash(),
+    }
+
+
+def _from_snapshot(snapshot):
+    user = User.from_db(DEFAULT_DB_ALIAS, snapshot['names'], snapshot['values'])
+    user._session_auth_hash = snapshot['session_auth_hash']
+    return user
+
+
+def forget_user(user_id):
+    transaction.on_commit(lambda: cache.delete(USER_KEY.format(user_id)))
+
+
+class CachedUserBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            user = _from_snapshot(snapshot)
+        else:
+            # From the primary: a lagging replica would cache the old profile.
+            try:
+                user = User._default_manager.db_manager(DEFAULT_DB_ALIAS).get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(key, _snapshot(user), USER_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
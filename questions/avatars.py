@@ -0,0 +1,84 @@
+import hashlib
+import io
+import logging
+from itertools import islice
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from .models import User, Question, Answer
+from . import jobs, auth, caching
+
+# Field on User -> edge in pixels. Listings show the small one, pages the large one.
+SIZES = {'avatar_small': 48, 'avatar_large': 96}
+THUMBNAIL_DIR = 'avatars/thumbs'
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+QUALITY = 80
+# Question versions bumped per cache round trip when an avatar changes.
+INVALIDATE_CHUNK = 1000
+
+log = logging.getLogger(__name__)
+
+
+def render(image, size):
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, FORMAT, quality=QUALITY)
+    return buffer.getvalue()
+
+
+def store(content):
+    # Named by content, so the file at a URL never changes and can be cached forever.
+    name = f'{THUMBNAIL_DIR}/{hashlib.sha256(content).hexdigest()[:20]}.{EXTENSION}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def make_thumbnails(user):
+    source = user.avatar.name
+    names = dict.fromkeys(SIZES, '')
+    try:
+        with user.avatar.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file)).convert('RGB')
+    except (OSError, Image.DecompressionBombError) as error:
+        # Not an image, a truncated or oversized one, or a file gone from the
+        # storage; remember it so it isn't retried, and show the default.
+        if not isinstance(error, UnidentifiedImageError):
+            log.warning('Unusable avatar %s for user %s: %s', source, user.pk, error)
+    else:
+        for field, size in SIZES.items():
+            names[field] = store(render(image, size))
+    # update() so saving the thumbnails doesn't fire post_save again, and only
+    # if the avatar wasn't replaced while this one was processed.
+    if User.objects.filter(pk=user.pk, avatar=source).update(avatar_thumbs_for=source, **names):
+        invalidate_pages_showing(user.pk)
+    auth.forget_user(user.pk)
+    return names
+
+
+def invalidate_pages_showing(user_id):
+    # Listings show the author's avatar on every question, and question
+    # pages show the avatars of the asker and each answerer.
+    question_ids = Question.objects.filter(author_id=user_id).values_list('id', flat=True)\
+        .union(Answer.objects.filter(author_id=user_id).values_list('question_id', flat=True))\
+        .iterator()
+    while chunk := list(islice(question_ids, INVALIDATE_CHUNK)):
+        caching.invalidate_questions(chunk, listed=True)
+
+
+@jobs.handler('avatar_thumbnails')
+def thumbnails_job(batch):
+    for user in User.objects.filter(id__in={user_id for user_id, in batch}):
+        if user.avatar:
+            make_thumbnails(user)
+
+
+def avatar_changed(user):
+    source = user.avatar.name or ''
+    if source == user.avatar_thumbs_for:
+        return
+    if source:
+        jobs.enqueue('avatar_thumbnails', user.pk)
+    else:
+        User.objects.filter(pk=user.pk).update(avatar_thumbs_for='', **dict.fromkeys(SIZES, ''))
+        invalidate_pages_showing(user.pk)
@@ -0,0 +1,279 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+# The pages version changes with which questions a listing shows and in what
+# order; the listings version also with anything shown about them, and backs
+# the listing ETags. Cached anonymous listings check their questions' own
+# versions instead, so a vote only invalidates the pages that show it.
+PAGES_VERSION_KEY = 'version:pages'
+LISTINGS_VERSION_KEY = 'version:listings'
+# Hot scores only order /hot/; search vectors only feed search counts.
+HOT_VERSION_KEY = 'version:hot'
+SEARCH_VERSION_KEY = 'version:search'
+QUESTION_VERSION_KEY = 'version:question:{}'
+PAGE_TIMEOUT = 60 * 5
+# /hot/ validators also expire this often, in case a refresh never reached the cache.
+HOT_BUCKET_SECONDS = 60
+CACHED_PARAMS = ('page', 'cursor')
+
+
+def is_shared(alias='default'):
+    # Whether other processes (workers, cron commands) see what this one writes.
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def _initial_version():
+    # Seeded from the clock so a flushed cache never hands out an old version again.
+    return time.time_ns() // 1000
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key, _initial_version())
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+    cache.set(f'{key}:at', int(time.time()), None)
+
+
+def _fingerprint(key):
+    # (version, unix time of the last bump), both from the cache.
+    version = _get_version(key)
+    modified = cache.get(f'{key}:at')
+    if modified is None:
+        cache.add(f'{key}:at', int(time.time()), None)
+        modified = cache.get(f'{key}:at')
+    return version, modified
+
+
+def pages_version():
+    return _get_version(PAGES_VERSION_KEY)
+
+
+def hot_version():
+    return f'{pages_version()}.{_get_version(HOT_VERSION_KEY)}'
+
+
+def search_version():
+    return _get_version(SEARCH_VERSION_KEY)
+
+
+def question_version(question_id):
+    return _get_version(QUESTION_VERSION_KEY.format(question_id))
+
+
+def question_versions(question_ids):
+    keys = [QUESTION_VERSION_KEY.format(question_id) for question_id in question_ids]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = _get_version(key)
+    return versions
+
+
+def note_listed(request, questions):
+    # Read before the page renders, so a later bump always wins.
+    request._listed_versions = question_versions(question.id for question in questions)
+
+
+def pages_fingerprint(**view_kwargs):
+    # Every listing (index, hot, each tag) shares the one listings version.
+    return _fingerprint(LISTINGS_VERSION_KEY)
+
+
+def hot_fingerprint(**view_kwargs):
+    # The listings, the last hot score refresh and the time: scores decay.
+    listings_version, listings_modified = _fingerprint(LISTINGS_VERSION_KEY)
+    hot_version, hot_modified = _fingerprint(HOT_VERSION_KEY)
+    bucket = int(time.time()) // HOT_BUCKET_SECONDS
+    modified = max(listings_modified, hot_modified, bucket * HOT_BUCKET_SECONDS)
+    return f'{listings_version}.{hot_version}.{bucket}', modified
+
+
+def question_fingerprint(question_id):
+    return _fingerprint(QUESTION_VERSION_KEY.format(question_id))
+
+
+def _bump_pages():
+    _bump(PAGES_VERSION_KEY)
+    _bump(LISTINGS_VERSION_KEY)
+
+
+def invalidate_pages():
+    transaction.on_commit(_bump_pages)
+
+
+def invalidate_question(question_id, listed=False):
+    # listed: the change shows in listings too (rating, answer count, title).
+    transaction.on_commit(lambda: _bump(QUESTION_VERSION_KEY.format(question_id)))
+    if listed:
+        transaction.on_commit(lambda: _bump(LISTINGS_VERSION_KEY))
+
+
+def invalidate_hot():
+    transaction.on_commit(lambda: _bump(HOT_VERSION_KEY))
+
+
+def invalidate_search():
+    transaction.on_commit(lambda: _bump(SEARCH_VERSION_KEY))
+
+
+def _bump_questions(question_ids, listed):
+    version = _initial_version()
+    now = int(time.time())
+    values = {}
+    for question_id in question_ids:
+        key = QUESTION_VERSION_KEY.format(question_id)
+        values[key] = version
+        values[f'{key}:at'] = now
+    cache.set_many(values, None)
+    if listed:
+        _bump(LISTINGS_VERSION_KEY)
+
+
+def invalidate_questions(question_ids, listed=False):
+    # One round trip for many questions; fresh clock versions stand in for incr.
+    question_ids = list(question_ids)
+    if question_ids:
+        transaction.on_commit(lambda: _bump_questions(question_ids, listed))
+
+
+def _page_key(request, view_name, kwargs, version):
+    parts = [view_name]
+    parts += [f'{name}={value}' for name, value in sorted(kwargs.items())]
+    parts += [f'{name}={request.GET.get(name, "")}' for name in CACHED_PARAMS]
+    digest = hashlib.md5('&'.join(parts).encode()).hexdigest()
+    return f'anonymous:{view_name}:{version()}:{digest}'
+
+
+def _cached_page(key):
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    content, content_type, versions = cached
+    if versions and cache.get_many(versions) != versions:
+        return None
+    return content, content_type
+
+
+def _store_page(request, key, content, content_type):
+    versions = getattr(request, '_listed_versions', {})
+    cache.set(key, (content, content_type, versions), PAGE_TIMEOUT)
+
+
+def _is_anonymous(request):
+    return not request.user.is_authenticated
+
+
+async def _stored_stream(request, key, content, content_type):
+    # Passes the chunks on as they come and caches the page once it is whole.
+    chunks = []
+    async for chunk in content:
+        chunks.append(chunk)
+        yield chunk
+    if not getattr(request, '_stream_failed', False):
+        await sync_to_async(_store_page)(request, key, b''.join(chunks), content_type)
+
+
+def cache_anonymous_page(view=None, version=pages_version):
+    # @cache_anonymous_page, or @cache_anonymous_page(version=...) for pages
+    # that also depend on something the pages version does not cover.
+    if view is None:
+        return lambda view: cache_anonymous_page(view, version)
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not await sync_to_async(_is_anonymous)(request):
+                return await view(request, *args, **kwargs)
+            key = await sync_to_async(_page_key)(request, view.__name__, kwargs, version)
+            cached = await sync_to_async(_cached_page)(key)
+            if cached is not None:
+                response = HttpResponse(cached[0], content_type=cached[1])
+            else:
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200 and response.streaming:
+                    response.streaming_content = _stored_stream(
+                        request, key, response.streaming_content, response['Content-Type'])
+                elif response.status_code == 200:
+                    await sync_to_async(_store_page)(request, key, response.content, response['Content-Type'])
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or not _is_anonymous(request):
+            return view(request, *args, **kwargs)
+        key = _page_key(request, view.__name__, kwargs, version)
+        cached = _cached_page(key)
+        if cached is not None:
+            response = HttpResponse(cached[0], content_type=cached[1])
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                _store_page(request, key, response.content, response['Content-Type'])
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapper
+
+
+def conditional_page(fingerprint):
+    # Answers If-None-Match / If-Modified-Since from fingerprint(**view_kwargs)
+    # alone, before the view runs any of its queries.
+    def precondition(request, kwargs):
+        version, modified = fingerprint(**kwargs)
+        parts = [str(version)]
+        if request.user.is_authenticated:
+            # The header shows the user and the page embeds their CSRF token.
+            parts += [str(request.user.pk), request.META.get('CSRF_COOKIE', '')]
+        etag = quote_etag(hashlib.md5(':'.join(parts).encode()).hexdigest())
+        return etag, modified, get_conditional_response(request, etag=etag, last_modified=modified)
+
+    def finish(request, response, etag, modified):
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            if modified:
+                response.headers.setdefault('Last-Modified', http_date(modified))
+            # Stored by browsers but revalidated on every use.
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                etag, modified, response = await sync_to_async(precondition)(request, kwargs)
+                if response is not None:
+                    return finish(request, response, etag, modified)
+                return finish(request, await view(request, *args, **kwargs), etag, modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, modified, response = precondition(request, kwargs)
+            if response is not None:
+                return finish(request, response, etag, modified)
+            return finish(request, view(request, *args, **kwargs), etag, modified)
+        return wrapper
+    return decorator
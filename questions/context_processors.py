@@ -1,6 +1,4 @@
-from .models import Tag
+from .sidebar import get_sidebar
 
 def global_settings(request):
-    return {
-        'popular_tags': Tag.objects.popular(),
-    }
+    return get_sidebar(request)
@@ -0,0 +1,47 @@
+from django.db import connection, transaction
+from .models import Question, TagFeed
+from . import listing
+
+TagLink = Question.tags.through
+
+
+def add_links(links):
+    # links: (tag_id, question_id) pairs that were just created.
+    links = list(links)
+    if not links:
+        return
+    created = dict(
+        Question.objects.filter(id__in={question_id for _, question_id in links}).values_list('id', 'created_at')
+    )
+    TagFeed.objects.bulk_create(
+        [TagFeed(tag_id=tag_id, question_id=question_id, created_at=created[question_id])
+         for tag_id, question_id in links if question_id in created],
+        ignore_conflicts=True,
+    )
+
+
+def remove_links(tag_ids=None, question_ids=None):
+    feed = TagFeed.objects.all()
+    if tag_ids is not None:
+        feed = feed.filter(tag_id__in=tag_ids)
+    if question_ids is not None:
+        feed = feed.filter(question_id__in=question_ids)
+    feed.delete()
+
+
+@transaction.atomic
+def rebuild(from_question_id=0):
+    TagFeed.objects.filter(question_id__gt=from_question_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {TagFeed._meta.db_table} (tag_id, question_id, created_at)
+            SELECT link.tag_id, link.question_id, q.created_at
+            FROM {TagLink._meta.db_table} link
+            JOIN {Question._meta.db_table} q ON q.id = link.question_id
+            WHERE link.question_id > %s
+        ''', [from_question_id])
+        return cursor.rowcount
+
+
+def hydrate(rows):
+    return listing.load([row.question_id for row in rows])
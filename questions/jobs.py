@@ -0,0 +1,140 @@
+import json
+import logging
+import time
+import traceback
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from .models import Job
+
+MAX_ATTEMPTS = 5
+MAX_BACKOFF_SECONDS = 300
+# A running job whose worker has not finished it by then is handed out again.
+LEASE = timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+handlers = {}
+
+
+def handler(name):
+    # Handlers get a list of argument lists, one per coalesced job, so a batch
+    # of jobs with the same name is done in one call.
+    def register(func):
+        handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, *args, delay=0):
+    args = list(args)
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: handlers[name]([args]))
+        return
+    # Written in the caller's transaction, so the job exists only if the write does.
+    Job.objects.bulk_create([Job(
+        name=name,
+        key=f'{name}:{json.dumps(args, separators=(",", ":"))}',
+        args=args,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )], ignore_conflicts=True)
+
+
+def queue_stats():
+    now = timezone.now()
+    depth = defaultdict(dict)
+    lag = {}
+    rows = Job.objects.order_by().values('name', 'status').annotate(count=Count('id'), oldest=Min('run_after'))
+    for row in rows:
+        depth[row['name']][row['status']] = row['count']
+        if row['status'] == Job.PENDING:
+            lag[row['name']] = round(max((now - row['oldest']).total_seconds(), 0.0), 3)
+    return {'depth': dict(depth), 'lag_seconds': lag}
+
+
+class Worker:
+    def __init__(self, batch_size=100):
+        self.batch_size = batch_size
+        self.stats = Counter()
+
+    def claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.PENDING, run_after__lte=now)
+                .order_by('run_after', 'id')[:self.batch_size]
+            )
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(status=Job.RUNNING, locked_at=now)
+        return jobs
+
+    def run_once(self):
+        jobs = self.claim()
+        batches = defaultdict(list)
+        for job in jobs:
+            batches[job.name].append(job)
+        for name, batch in batches.items():
+            self.run_batch(name, batch)
+        return len(jobs)
+
+    def run_batch(self, name, batch):
+        try:
+            func = handlers[name]
+            with transaction.atomic():
+                func([job.args for job in batch])
+        except Exception:
+            if len(batch) == 1:
+                logger.exception('Job %s failed', batch[0].key)
+                self.retry(batch, traceback.format_exc())
+                return
+            # One bad job must not hold back or use up attempts of the rest:
+            # rerun the batch a job at a time and retry only those that fail.
+            logger.warning('Job batch %s failed, running its %d jobs one by one', name, len(batch), exc_info=True)
+            for job in batch:
+                self.run_batch(name, [job])
+        else:
+            Job.objects.filter(id__in=[job.id for job in batch]).delete()
+            self.stats['done'] += len(batch)
+            self.stats['batches'] += 1
+
+    def retry(self, jobs, error):
+        now = timezone.now()
+        for job in jobs:
+            job.attempts += 1
+            job.last_error = error
+            job.locked_at = None
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = Job.FAILED
+                self.stats['failed'] += 1
+            else:
+                job.status = Job.PENDING
+                job.run_after = now + timedelta(seconds=min(2 ** job.attempts, MAX_BACKOFF_SECONDS))
+                self.stats['retried'] += 1
+            try:
+                with transaction.atomic():
+                    job.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'run_after'])
+            except IntegrityError:
+                # An identical job was queued meanwhile and will redo the work.
+                job.delete()
+
+    def release_stale(self):
+        stale = list(Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - LEASE))
+        if stale:
+            self.retry(stale, 'Lease expired before the job finished.')
+        return len(stale)
+
+    def run(self, poll_interval=1.0, once=False):
+        while True:
+            try:
+                if self.run_once():
+                    continue
+            except DatabaseError:
+                # Lock timeouts and dropped connections; a claim rolls back whole.
+                logger.exception('Could not claim jobs')
+                self.stats['claim_errors'] += 1
+            if once:
+                return
+            self.release_stale()
+            time.sleep(poll_interval)
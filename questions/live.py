@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import json
+import logging
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from .models import Question, Answer
+from .async_views import _in_thread
+
+CHANNEL = 'questions_live'
+# Changes arriving this close together go out as one batch.
+FLUSH_DELAY = 0.1
+POLL_SECONDS = 2
+KEEPALIVE_SECONDS = 15
+# Streams are closed after this long and reopened by the browser, which
+# also bounds watchers whose client went away without us noticing.
+STREAM_SECONDS = 300
+RETRY_MS = 3000
+QUEUE_SIZE = 100
+CATCH_UP_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+
+# A change is (kind, question_id, object_id) with kind one of 'answer',
+# 'answer_rating' or 'question_rating'.
+
+
+def publish(kind, question_id, object_id):
+    if connection.vendor != 'postgresql':
+        # Picked up by the poller instead.
+        return
+    # Delivered when the transaction commits, and not at all if it rolls back.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps([kind, question_id, object_id])])
+
+
+def _message(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def _answer_message(answer):
+    # The answer id doubles as the event id, so a reconnecting browser sends
+    # it back as Last-Event-ID and gets what it missed.
+    html = render_to_string('blocks/answer_item.html', {'answer': answer})
+    return _message('answer', {'id': answer.id, 'html': html}, answer.id)
+
+
+def load_messages(changes):
+    # Runs once per batch however many watchers there are.
+    by_kind = defaultdict(set)
+    for kind, question_id, object_id in changes:
+        by_kind[kind].add(object_id)
+    messages = []
+    for question_id, rating in Question.objects.filter(id__in=by_kind['question_rating']).values_list('id', 'rating'):
+        messages.append((question_id, _message('rating', {'question': question_id, 'rating': rating})))
+    answer_ratings = Answer.objects.filter(id__in=by_kind['answer_rating'] - by_kind['answer'])
+    for answer_id, question_id, rating in answer_ratings.values_list('id', 'question_id', 'rating'):
+        messages.append((question_id, _message('rating', {'answer': answer_id, 'rating': rating})))
+    for answer in Answer.objects.filter(id__in=by_kind['answer']).select_related('author').order_by('id'):
+        messages.append((answer.question_id, _answer_message(answer)))
+    return messages
+
+
+def catch_up(question_id, after):
+    rating = Question.objects.values_list('rating', flat=True).get(pk=question_id)
+    messages = [_message('rating', {'question': question_id, 'rating': rating})]
+    if after is not None:
+        answers = Answer.objects.filter(question_id=question_id, id__gt=after).select_related('author')
+        messages += [_answer_message(answer) for answer in reversed(answers.order_by('-id')[:CATCH_UP_LIMIT])]
+    return messages
+
+
+class Poller:
+    # Without LISTEN/NOTIFY, diffs the watched questions against the last poll:
+    # one pair of queries per process per interval, whatever the watcher count.
+    def __init__(self):
+        self.ratings = {}
+        self.answers = {}
+
+    def changes(self, question_ids):
+        for question_id in set(self.ratings) - question_ids:
+            del self.ratings[question_id]
+            self.answers.pop(question_id, None)
+        changes = []
+        for question_id, rating in Question.objects.filter(id__in=question_ids).values_list('id', 'rating'):
+            if self.ratings.get(question_id, rating) != rating:
+                changes.append(('question_rating', question_id, question_id))
+            self.ratings[question_id] = rating
+        answers = defaultdict(dict)
+        rows = Answer.objects.filter(question_id__in=question_ids).values_list('id', 'question_id', 'rating')
+        for answer_id, question_id, rating in rows:
+            answers[question_id][answer_id] = rating
+        for question_id in question_ids:
+            current = answers.get(question_id, {})
+            previous = self.answers.get(question_id)
+            # The first poll of a question only records where it stands.
+            if previous is not None:
+                for answer_id, rating in current.items():
+                    if answer_id not in previous:
+                        changes.append(('answer', question_id, answer_id))
+                    elif previous[answer_id] != rating:
+                        changes.append(('answer_rating', question_id, answer_id))
+            self.answers[question_id] = current
+        return changes
+
+
+def _listen_connection():
+    wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+    wrapper.ensure_connection()
+    listener = wrapper.connection
+    listener.autocommit = True
+    with listener.cursor() as cursor:
+        cursor.execute(f'LISTEN {CHANNEL}')
+    return listener
+
+
+class Broker:
+    # One per process: every stream on a question shares the same queries and
+    # encoded messages, and waits on its own queue in between.
+    def __init__(self):
+        self.loop = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.watchers = defaultdict(set)
+        self.pending = set()
+        self.flushing = None
+        # A fresh context, not the first subscriber's request: outside a request
+        # the router reads from the primary, which NOTIFY is sent from.
+        self.source = loop.create_task(self.run(), context=contextvars.Context())
+
+    def subscribe(self, question_id):
+        self._start()
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.watchers[question_id].add(queue)
+        return queue
+
+    def unsubscribe(self, question_id, queue):
+        watchers = self.watchers.get(question_id)
+        if watchers is not None:
+            watchers.discard(queue)
+            if not watchers:
+                del self.watchers[question_id]
+
+    def notify(self, changes):
+        self.pending.update(change for change in changes if change[1] in self.watchers)
+        if self.pending and self.flushing is None:
+            self.flushing = self.loop.create_task(self.flush())
+
+    async def flush(self):
+        await asyncio.sleep(FLUSH_DELAY)
+        changes, self.pending = self.pending, set()
+        try:
+            messages = await _in_thread(load_messages, changes)
+        finally:
+            self.flushing = None
+            if self.pending:
+                self.flushing = self.loop.create_task(self.flush())
+        for question_id, message in messages:
+            for queue in list(self.watchers.get(question_id, ())):
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # A client that stopped reading: end its stream, and it
+                    # catches up from Last-Event-ID when it reconnects.
+                    self.unsubscribe(question_id, queue)
+                    queue.get_nowait()
+                    queue.put_nowait(None)
+
+    async def run(self):
+        while True:
+            try:
+                if connection.vendor == 'postgresql':
+                    await self.listen()
+                else:
+                    await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Live update source failed, restarting')
+                await asyncio.sleep(POLL_SECONDS)
+
+    async def poll(self):
+        poller = Poller()
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            if self.watchers:
+                self.notify(await _in_thread(poller.changes, set(self.watchers)))
+
+    async def listen(self):
+        listener = await sync_to_async(_listen_connection, thread_sensitive=False)()
+        lost = self.loop.create_future()
+
+        def readable():
+            try:
+                listener.poll()
+            except Exception as error:
+                if not lost.done():
+                    lost.set_exception(error)
+                return
+            changes = []
+            while listener.notifies:
+                changes.append(tuple(json.loads(listener.notifies.pop(0).payload)))
+            self.notify(changes)
+
+        self.loop.add_reader(listener.fileno(), readable)
+        try:
+            await lost
+        finally:
+            self.loop.remove_reader(listener.fileno())
+            listener.close()
+
+
+broker = Broker()
+
+
+def _event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _events(question_id, after):
+    # Subscribed before catching up, so nothing falls in between; the page
+    # drops anything it already shows.
+    queue = broker.subscribe(question_id)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        for message in await _in_thread(catch_up, question_id, after):
+            yield message
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_SECONDS
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                message = await asyncio.wait_for(queue.get(), min(KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if message is None:
+                break
+            yield message
+    finally:
+        broker.unsubscribe(question_id, queue)
+
+
+async def question_events(request, question_id):
+    if not await Question.objects.filter(pk=question_id).aexists():
+        raise Http404('No Question matches the given query.')
+    # New answers are only shown on the first page, which sends ?after.
+    after = _event_id(request.GET.get('after'))
+    last_event_id = _event_id(request.headers.get('Last-Event-ID'))
+    if after is not None and last_event_id is not None:
+        after = max(after, last_event_id)
+    response = StreamingHttpResponse(_events(question_id, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,71 @@
+import datetime
+import gzip
+import json
+import os
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from questions.models import Tag, Question, Answer, QuestionLike, AnswerLike
+
+MANIFEST = 'manifest.json'
+FORMAT = 1
+# Maintained by questions.search after the import instead.
+SKIPPED_COLUMNS = {'search_vector'}
+
+
+def tables():
+    # In dependency order, so every table only points at tables above it.
+    return [
+        ('users', get_user_model()),
+        ('tags', Tag),
+        ('questions', Question),
+        ('question_tags', Question.tags.through),
+        ('answers', Answer),
+        ('question_likes', QuestionLike),
+        ('answer_likes', AnswerLike),
+    ]
+
+
+def columns(model):
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname not in SKIPPED_COLUMNS
+    ]
+
+
+class Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; ids and ordering
+    # survive that, but created_at ties would not.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def chunk_name(table, number, compress):
+    return f'{table}.{number:05d}.jsonl' + ('.gz' if compress else '')
+
+
+def open_chunk(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+
+def dump_row(columns, row):
+    return json.dumps(dict(zip(columns, row)), cls=Encoder, ensure_ascii=False) + '\n'
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_manifest(directory, manifest):
+    # Written after every chunk; the rename keeps it whole if the export dies.
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
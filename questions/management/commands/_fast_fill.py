@@ -0,0 +1,224 @@
+import csv
+import io
+import random
+import time
+from collections import deque
+from datetime import timedelta
+from multiprocessing import get_context
+from faker import Faker
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+
+
+def _rng(seed, table, chunk_start):
+    return random.Random(f'{seed}:{table}:{chunk_start}')
+
+
+def _faker(rng):
+    fake = Faker()
+    fake.seed_instance(rng.random())
+    return fake
+
+
+def _created_at(rng, now):
+    return now - timedelta(seconds=rng.randint(0, MAX_AGE_SECONDS))
+
+
+def gen_users(task):
+    start, count, plan = task
+    rng = _rng(plan['seed'], 'users', start)
+    fake = _faker(rng)
+    rows = []
+    for pk in range(plan['user_base'] + start + 1, plan['user_base'] + start + count + 1):
+        word = fake.word()
+        rows.append((pk, f'{word}_{pk}', f'{word}_{pk}@example.com', plan['password']))
+    return rows
+
+
+def gen_tags(task):
+    start, count, plan = task
+    fake = _faker(_rng(plan['seed'], 'tags', start))
+    return [
+        (pk, f'{fake.word()}_{pk}')
+        for pk in range(plan['tag_base'] + start + 1, plan['tag_base'] + start + count + 1)
+    ]
+
+
+def gen_questions(task):
+    start, count, plan = task
+    rng = _rng(plan['seed'], 'questions', start)
+    fake = _faker(rng)
+    rows = []
+    for pk in range(plan['question_base'] + start + 1, plan['question_base'] + start + count + 1):
+        rows.append((
+            pk,
+            plan['user_base'] + rng.randint(1, plan['users']),
+            fake.sentence(nb_words=5),
+            fake.paragraph(nb_sentences=3),
+            _created_at(rng, plan['now']),
+        ))
+    return rows
+
+
+def gen_question_tags(task):
+    start, count, plan = task
+    rng = _rng(plan['seed'], 'question_tags', start)
+    rows = []
+    for pk in range(plan['question_base'] + start + 1, plan['question_base'] + start + count + 1):
+        k = rng.randint(1, min(4, plan['tags']))
+        for offset in rng.sample(range(1, plan['tags'] + 1), k):
+            rows.append((pk, plan['tag_base'] + offset))
+    return rows
+
+
+def gen_answers(task):
+    start, count, plan = task
+    rng = _rng(plan['seed'], 'answers', start)
+    fake = _faker(rng)
+    rows = []
+    for pk in range(plan['answer_base'] + start + 1, plan['answer_base'] + start + count + 1):
+        rows.append((
+            pk,
+            plan['user_base'] + rng.randint(1, plan['users']),
+            plan['question_base'] + rng.randint(1, plan['questions']),
+            fake.paragraph(nb_sentences=2),
+            _created_at(rng, plan['now']),
+        ))
+    return rows
+
+
+def _gen_likes(task, table, base_key, total_key):
+    # Every user likes a distinct sample of targets, so (user, target) never repeats.
+    start, count, plan = task
+    rng = _rng(plan['seed'], table, start)
+    per_user = min(plan['likes_per_user'], plan[total_key])
+    rows = []
+    for user_id in range(plan['user_base'] + start + 1, plan['user_base'] + start + count + 1):
+        for offset in rng.sample(range(1, plan[total_key] + 1), per_user):
+            rows.append((user_id, plan[base_key] + offset, rng.choice((1, -1))))
+    return rows
+
+
+def gen_question_likes(task):
+    return _gen_likes(task, 'question_likes', 'question_base', 'questions')
+
+
+def gen_answer_likes(task):
+    return _gen_likes(task, 'answer_likes', 'answer_base', 'answers')
+
+
+class TableLoader:
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = list(columns)
+        self.extra_columns = []
+        self.extra_values = []
+        now = timezone.now()
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        self.fields = [fields[attname] for attname in self.columns]
+        for field in model._meta.concrete_fields:
+            if field.attname in self.columns or field.primary_key:
+                continue
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                value = now
+            else:
+                value = field.get_default()
+            self.extra_columns.append(field.column)
+            self.extra_values.append(field.get_db_prep_save(value, connection))
+        self.use_copy = connection.vendor == 'postgresql'
+
+    def load(self, rows):
+        if self.use_copy:
+            self._copy(rows)
+        else:
+            self._insert(rows)
+
+    def _column_list(self):
+        return ', '.join(
+            connection.ops.quote_name(name)
+            for name in [field.column for field in self.fields] + self.extra_columns
+        )
+
+    def _copy(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        extra = tuple(self.extra_values)
+        for row in rows:
+            writer.writerow(tuple(row) + extra)
+        buffer.seek(0)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(f'COPY {table} ({self._column_list()}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def _insert(self, rows):
+        # A plain INSERT rather than bulk_create, which would overwrite the
+        # auto_now / auto_now_add values passed in the rows.
+        extra = tuple(self.extra_values)
+        params = [
+            tuple(field.get_db_prep_save(field.to_python(value), connection)
+                  for field, value in zip(self.fields, row)) + extra
+            for row in rows
+        ]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        placeholders = ', '.join(['%s'] * (len(self.fields) + len(extra)))
+        # One transaction per chunk, as bulk_create had; autocommit would commit every row.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {table} ({self._column_list()}) VALUES ({placeholders})', params)
+
+
+def next_id(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def reset_sequences(models):
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def stream(generator, total, chunk_size, plan, workers, pool):
+    # Yields (units, rows) per chunk in order, generating ahead in the pool.
+    tasks = deque(
+        (start, min(chunk_size, total - start), plan)
+        for start in range(0, total, chunk_size)
+    )
+    if pool is None:
+        while tasks:
+            task = tasks.popleft()
+            yield task[1], generator(task)
+        return
+    # Keep at most two chunks per worker in flight so memory stays bounded.
+    pending = deque()
+    while tasks or pending:
+        while tasks and len(pending) < workers * 2:
+            task = tasks.popleft()
+            pending.append((task[1], pool.apply_async(generator, (task,))))
+        units, result = pending.popleft()
+        yield units, result.get()
+
+
+def make_pool(workers):
+    if workers <= 1:
+        return None
+    return get_context('fork').Pool(workers)
+
+
+class Progress:
+    def __init__(self, write, label, total):
+        self.write = write
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, units, rows):
+        self.done += units
+        self.rows += rows
+        elapsed = time.monotonic() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        self.write(f'  {self.label}: {self.done * 100 // self.total}% ({self.rows} rows, {rate:,.0f} rows/s)')
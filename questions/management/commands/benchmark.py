@@ -0,0 +1,287 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+import json
+import platform
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+import django
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.urls import reverse
+from django.utils import timezone
+from questions.models import Tag, Question, Answer
+from questions.profiling import QueryRecorder
+
+HOST = 'localhost'
+RUNNERS = ('client', 'wsgi', 'asgi')
+PERCENTILES = (50, 90, 95, 99)
+# Cleared before every measured request, so never the shared cache.
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def timed(get, path):
+    started = time.perf_counter()
+    status = get(path)
+    return status, (time.perf_counter() - started) * 1000
+
+
+class ThreadedRunner:
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(concurrency) if concurrency > 1 else None
+
+    def get_many(self, path):
+        if self.executor is None:
+            return [timed(self.get, path)]
+        return list(self.executor.map(lambda _: timed(self.get, path), range(self.concurrency)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class ClientRunner(ThreadedRunner):
+    def get(self, path):
+        response = Client().get(path, HTTP_HOST=HOST)
+        if response.streaming:
+            b''.join(response)
+        return response.status_code
+
+
+class WSGIRunner(ThreadedRunner):
+    def __init__(self, concurrency):
+        super().__init__(concurrency)
+        self.application = WSGIHandler()
+
+    def get(self, path):
+        url = urlsplit(path)
+        environ = {'PATH_INFO': url.path, 'QUERY_STRING': url.query, 'HTTP_HOST': HOST,
+                   'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr}
+        setup_testing_defaults(environ)
+        status = []
+        body = self.application(environ, lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return int(status[0].split()[0])
+
+
+class ASGIRunner:
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.application = ASGIHandler()
+        self.loop = asyncio.new_event_loop()
+
+    async def _get(self, path):
+        url = urlsplit(path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(),
+            'query_string': url.query.encode(), 'headers': [(b'host', HOST.encode())],
+            'server': (HOST, 80), 'client': ('127.0.0.1', 0),
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        status = []
+
+        async def receive():
+            return messages.pop() if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            # Streaming bodies arrive as several http.response.body messages.
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await self.application(scope, receive, send)
+        return status[0]
+
+    async def _timed(self, path):
+        started = time.perf_counter()
+        status = await self._get(path)
+        return status, (time.perf_counter() - started) * 1000
+
+    async def _get_many(self, path):
+        return await asyncio.gather(*(self._timed(path) for _ in range(self.concurrency)))
+
+    def get_many(self, path):
+        return self.loop.run_until_complete(self._get_many(path))
+
+    def close(self):
+        self.loop.close()
+
+
+RUNNER_CLASSES = {'client': ClientRunner, 'wsgi': WSGIRunner, 'asgi': ASGIRunner}
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every listing and question page and compares the results with a saved baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ratio', type=int,
+                            help='Seed a throwaway test database with fill_db --fast at this ratio and benchmark that.')
+        parser.add_argument('--seed', type=int, default=2025, help='Seed used when filling the database.')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per page.')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per page.')
+        parser.add_argument('--runner', choices=RUNNERS, action='append', help='Runner(s) to use, all by default.')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Requests in flight at once (threads for client/wsgi, tasks for asgi).')
+        parser.add_argument('--async-views', action='store_true',
+                            help='Serve pages through askpupkin.async_urls (compare asgi with it against wsgi without).')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep caches between requests instead of clearing them before each one.')
+        parser.add_argument('--output', default='benchmark.json', help='File the results are written to.')
+        parser.add_argument('--baseline', help='Results file to compare against.')
+        parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 slowdown before a latency warning.')
+        parser.add_argument('--fail-on-latency', action='store_true', help='Treat latency warnings as failures.')
+
+    def seed(self, ratio, seed):
+        # The test databases (test_ prefixed, or in memory for SQLite) are
+        # created here and dropped afterwards; the configured ones stay untouched.
+        self.stdout.write(f'Seeding a test database with ratio {ratio} (seed {seed})...')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        call_command('fill_db', ratio, fast=True, seed=seed, stdout=io.StringIO())
+        return old_config
+
+    def pages(self):
+        if not Question.objects.exists():
+            raise CommandError('The database is empty; pass --ratio to seed it.')
+        questions = Question.objects.count()
+        pages = {
+            'index': reverse('index'),
+            'index_deep': f"{reverse('index')}?page={max(1, questions // 10 // 2)}",
+            'index_last': f"{reverse('index')}?page={max(1, -(-questions // 10))}",
+            'hot': reverse('hot'),
+            'hot_deep': f"{reverse('hot')}?page={max(1, questions // 10 // 2)}",
+        }
+        tag = Tag.objects.annotate(total=Count('question')).order_by('-total', 'id').first()
+        if tag is not None:
+            pages['tag'] = reverse('tag', kwargs={'tag_name': tag.name})
+            pages['tag_deep'] = f"{pages['tag']}?page={max(1, tag.total // 10 // 2)}"
+        question = Question.objects.order_by('-answer_count', 'id').first()
+        pages['question'] = reverse('question', kwargs={'question_id': question.pk})
+        answers = Answer.objects.filter(question=question).count()
+        pages['question_deep'] = f"{pages['question']}?page={max(1, -(-answers // 5))}"
+        return pages
+
+    def measure(self, runner, path, options, recorder):
+        for _ in range(options['warmup']):
+            runner.get_many(path)
+        latencies, queries, sql_times = [], [], []
+        while len(latencies) < options['requests']:
+            if not options['warm_cache']:
+                cache.clear()
+            recorder.reset()
+            batch = runner.get_many(path)
+            for status, latency in batch:
+                if status != 200:
+                    raise CommandError(f'{path} answered {status}.')
+                latencies.append(latency)
+            # With concurrency > 1 these are averages over the batch.
+            queries.append(round(recorder.count / len(batch)))
+            sql_times.append(recorder.total_time * 1000 / len(batch))
+        result = {'path': path, 'requests': len(latencies), 'mean_ms': statistics.mean(latencies)}
+        result.update({f'p{p}_ms': percentile(latencies, p) for p in PERCENTILES})
+        result['queries'] = max(queries)
+        result['sql_ms'] = statistics.mean(sql_times)
+        return result
+
+    def compare(self, results, baseline, options):
+        failures, warnings = [], []
+        for name, result in results.items():
+            before = baseline.get('pages', {}).get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                failures.append(f"{name}: {before['queries']} -> {result['queries']} queries per request")
+            if result['p95_ms'] > before['p95_ms'] * (1 + options['latency_tolerance']):
+                warnings.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        for line in warnings:
+            self.stdout.write(self.style.WARNING(f'Slower: {line}'))
+        if options['fail_on_latency']:
+            failures += warnings
+        if failures:
+            raise CommandError('Benchmark regressions:\n' + '\n'.join(failures))
+
+    def handle(self, *args, **options):
+        old_config = self.seed(options['ratio'], options['seed']) if options['ratio'] else None
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                self.run(options)
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+    def run(self, options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        pages = self.pages()
+        recorder = QueryRecorder()
+        recorder.install()
+        results = {}
+        urlconf = override_settings(ROOT_URLCONF='askpupkin.async_urls') if options['async_views'] else None
+        if urlconf is not None:
+            urlconf.enable()
+        try:
+            for runner_name in options['runner'] or RUNNERS:
+                runner = RUNNER_CLASSES[runner_name](max(1, options['concurrency']))
+                try:
+                    for page_name, path in pages.items():
+                        result = self.measure(runner, path, options, recorder)
+                        results[f'{runner_name}:{page_name}'] = result
+                        self.stdout.write(
+                            f"{runner_name:>6} {page_name:<14} p50 {result['p50_ms']:7.1f}ms  "
+                            f"p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms  "
+                            f"{result['queries']:3d} queries  {result['sql_ms']:6.1f}ms SQL"
+                        )
+                finally:
+                    runner.close()
+        finally:
+            recorder.uninstall()
+            if urlconf is not None:
+                urlconf.disable()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'ratio': options['ratio'],
+                'seed': options['seed'],
+                'questions': Question.objects.count(),
+                'warm_cache': options['warm_cache'],
+                'concurrency': options['concurrency'],
+                'async_views': options['async_views'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'pages': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        if baseline is not None:
+            self.compare(results, baseline, options)
+            self.stdout.write(self.style.SUCCESS('No query-count regressions against the baseline.'))
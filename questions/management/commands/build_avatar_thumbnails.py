@@ -0,0 +1,51 @@
+import time
+from multiprocessing import get_context
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+from questions.avatars import make_thumbnails
+from questions.models import User
+
+
+def process(user_ids):
+    done = 0
+    for user in User.objects.filter(id__in=user_ids).only('id', 'avatar'):
+        make_thumbnails(user)
+        done += 1
+    return done
+
+
+def chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'Creates avatar thumbnails for users whose avatar has none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes.')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Users per task.')
+        parser.add_argument('--force', action='store_true', help='Rebuild thumbnails for every avatar.')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['force']:
+            users = users.exclude(avatar_thumbs_for=F('avatar'))
+        user_ids = list(users.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'Creating thumbnails for {len(user_ids)} avatars...')
+        started = time.monotonic()
+        tasks = chunks(user_ids, options['chunk_size'])
+
+        done = 0
+        if options['workers'] <= 1:
+            for task in tasks:
+                done += process(task)
+        else:
+            # Children must open their own connections.
+            connections.close_all()
+            with get_context('fork').Pool(options['workers']) as pool:
+                for count in pool.imap_unordered(process, tasks):
+                    done += count
+                    self.stdout.write(f'  {done}/{len(user_ids)}')
+        self.stdout.write(self.style.SUCCESS(f'Created thumbnails for {done} avatars in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from questions.models import Question
+from questions import related
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the related questions of every question from tag overlap; run it nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=related.CHUNK_SIZE,
+                            help='Questions scored and stored per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for total in related.rebuild(options['chunk_size']):
+            self.stdout.write(f'  {total} questions')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Related questions for {total} of {Question.objects.count()} questions in {elapsed:.1f}s '
+            f'({total / elapsed if elapsed else 0:,.0f}/s).'
+        ))
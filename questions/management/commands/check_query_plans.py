@@ -0,0 +1,85 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from questions.models import User, Tag, TagFeed, Question, Answer
+from questions.pagination import _seek
+from questions import listing
+
+PER_PAGE = 10
+
+# Plan lines that mean the database reads or sorts a whole table.
+PLAN_PROBLEMS = {
+    'postgresql': [re.compile(r'Seq Scan on (\w+)'), re.compile(r'^\s*(?:->\s*)?((?:Incremental )?Sort)\b')],
+    'sqlite': [re.compile(r'\bSCAN (\w+)$'), re.compile(r'(USE TEMP B-TREE FOR ORDER BY)')],
+}
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on every view's listing query and fails if one needs a full scan or a sort."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip', action='append', default=[],
+                            help='Report but do not fail on this check (e.g. "hot"); repeatable.')
+
+    def keys(self, queryset, ordering):
+        row = queryset.order_by(*ordering).values(*[field.lstrip('-') for field in ordering])[PER_PAGE:PER_PAGE + 1]
+        row = list(row)
+        return [row[0][field.lstrip('-')] for field in ordering] if row else None
+
+    def listing(self, name, queryset, ordering):
+        plans = [(name, queryset.order_by(*ordering)[:PER_PAGE + 1])]
+        keys = self.keys(queryset, ordering)
+        if keys is not None:
+            plans.append((f'{name} (cursor)', queryset.filter(_seek(ordering, keys)).order_by(*ordering)[:PER_PAGE + 1]))
+        return plans
+
+    def querysets(self):
+        tag = Tag.objects.annotate(total=Count('question')).order_by('-total', 'id').first()
+        question = Question.objects.order_by('-answer_count', 'id').first()
+        if tag is None or question is None:
+            raise CommandError('The database is empty; seed it with fill_db first.')
+
+        plans = []
+        plans += self.listing('index', listing.key_queryset(Question.NEW_ORDERING), Question.NEW_ORDERING)
+        plans += self.listing('hot', listing.key_queryset(Question.HOT_ORDERING), Question.HOT_ORDERING)
+        plans += self.listing('tag', TagFeed.objects.filter(tag=tag), TagFeed.ORDERING)
+        plans += self.listing('question answers', Answer.objects.filter(question=question).select_related('author'),
+                              Answer.ORDERING)
+        author = Answer.objects.values_list('author_id', flat=True).order_by('-id').first()
+        plans += self.listing('user questions', listing.key_queryset(Question.NEW_ORDERING).filter(author_id=author),
+                              Question.NEW_ORDERING)
+        plans += self.listing('user answers', Answer.objects.filter(author_id=author).select_related('question'),
+                              Answer.ORDERING)
+        plans.append(('best members', User.objects.order_by(*User.REPUTATION_ORDERING)[:PER_PAGE]))
+        question_ids = list(Question.objects.new().values_list('id', flat=True)[:PER_PAGE])
+        plans.append(('listing rows', listing.load_queryset(question_ids)))
+        return plans
+
+    def handle(self, *args, **options):
+        patterns = PLAN_PROBLEMS.get(connection.vendor)
+        if patterns is None:
+            raise CommandError(f'Plan checks are not implemented for {connection.vendor}.')
+
+        failures = []
+        for name, queryset in self.querysets():
+            plan = queryset.explain()
+            problems = [
+                match.group(1)
+                for line in plan.splitlines()
+                for pattern in patterns
+                for match in [pattern.search(line)]
+                if match
+            ]
+            if problems:
+                skipped = name.split(' (')[0] in options['skip']
+                if not skipped:
+                    failures.append(name)
+                style = self.style.WARNING if skipped else self.style.ERROR
+                self.stdout.write(style(f'{name}: {", ".join(problems)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+
+        if failures:
+            raise CommandError(f'Full scans or sorts in: {", ".join(failures)}.')
@@ -0,0 +1,57 @@
+import os
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+STATIC_TAG = re.compile(r"""{%\s*static\s+(['"]?)([^'"\s%]+)\1""")
+URL_ATTRIBUTE = re.compile(r"""(?:src|href)\s*=\s*["']([^"'{]+)["']""")
+
+
+class Command(BaseCommand):
+    help = 'Fails if a template links a static asset without its content-hashed name.'
+
+    def templates(self):
+        for engine in engines.all():
+            for directory in engine.template_dirs:
+                for root, _, filenames in os.walk(directory):
+                    for filename in filenames:
+                        if filename.endswith('.html'):
+                            path = os.path.join(root, filename)
+                            yield os.path.relpath(path, directory), path
+
+    def check_template(self, source):
+        problems = []
+        for quote, name in STATIC_TAG.findall(source):
+            if not quote:
+                problems.append(f'{name}: built from a variable, so it cannot be checked')
+                continue
+            try:
+                hashed = staticfiles_storage.stored_name(name)
+            except ValueError as error:
+                problems.append(f'{name}: {error}')
+                continue
+            if hashed == name:
+                problems.append(f'{name}: has no hashed name')
+        for url in URL_ATTRIBUTE.findall(source):
+            if url.startswith(settings.STATIC_URL) or '/static/' in url:
+                problems.append(f'{url}: hard-coded static URL, use the static tag')
+        return problems
+
+    def handle(self, *args, **options):
+        if not hasattr(staticfiles_storage, 'stored_name'):
+            raise CommandError('STORAGES["staticfiles"] does not hash file names.')
+        if not staticfiles_storage.hashed_files:
+            raise CommandError('No staticfiles manifest; run collectstatic first.')
+
+        failures = 0
+        for name, path in sorted(self.templates()):
+            with open(path, encoding='utf-8') as file:
+                problems = self.check_template(file.read())
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'{name}: {problem}'))
+            failures += len(problems)
+        if failures:
+            raise CommandError(f'{failures} static references are not fingerprinted.')
+        self.stdout.write(self.style.SUCCESS('Every static reference resolves to a hashed file.'))
@@ -0,0 +1,64 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from . import _dataset as dataset
+
+
+class Command(BaseCommand):
+    help = 'Streams users, tags, questions, answers and likes to chunked JSONL files, ids included.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Where to write the chunks and manifest.json.')
+        parser.add_argument('--compress', action='store_true', help='Gzip every chunk.')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per chunk file.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue an interrupted export after its last finished chunk.')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        manifest = dataset.read_manifest(directory)
+        if manifest is not None and not options['resume']:
+            raise CommandError(f'{directory} already holds an export; pass --resume or pick another directory.')
+        if manifest is None:
+            manifest = {'format': dataset.FORMAT, 'compress': options['compress'], 'tables': {}}
+
+        started = time.monotonic()
+        total = 0
+        for table, model in dataset.tables():
+            entry = manifest['tables'].setdefault(
+                table, {'columns': dataset.columns(model), 'chunks': [], 'complete': False})
+            if entry['complete']:
+                self.stdout.write(f'{table}: already exported')
+                continue
+            total += self.export_table(directory, manifest, table, model, entry, options['chunk_size'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s).'
+        ))
+
+    def export_table(self, directory, manifest, table, model, entry, chunk_size):
+        columns = entry['columns']
+        last_id = entry['chunks'][-1]['last_id'] if entry['chunks'] else 0
+        started = time.monotonic()
+        rows = 0
+        while True:
+            # Keyset pages: a resumed export picks up after the last id written.
+            batch = list(
+                model.objects.filter(id__gt=last_id).order_by('id').values_list(*columns)[:chunk_size]
+            )
+            if not batch:
+                break
+            name = dataset.chunk_name(table, len(entry['chunks']), manifest['compress'])
+            with dataset.open_chunk(os.path.join(directory, name), 'w') as file:
+                file.writelines(dataset.dump_row(columns, row) for row in batch)
+            last_id = batch[-1][0]
+            entry['chunks'].append({'file': name, 'rows': len(batch), 'last_id': last_id})
+            dataset.write_manifest(directory, manifest)
+            rows += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {table}: {rows} rows ({rows / elapsed if elapsed else 0:,.0f} rows/s)')
+        entry['complete'] = True
+        dataset.write_manifest(directory, manifest)
+        return rows
@@ -1,12 +1,15 @@
+import os
 import random
+import time
 from faker import Faker
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models import Sum, OuterRef, Subquery
-from django.db.models.functions import Coalesce
+from django.utils import timezone
 from questions.models import Tag, Question, Answer, QuestionLike, AnswerLike
+from questions import sidebar, caching, search, feeds, ranking, related, reputation
+from . import _fast_fill as fast
 
 User = get_user_model()
 
@@ -15,10 +18,55 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('ratio', type=int, help='The ratio for data generation.')
-    
-    @transaction.atomic
+        parser.add_argument('--fast', action='store_true',
+                            help='Generate rows in worker processes and stream them in chunks (COPY on PostgreSQL).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes for --fast.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per generated chunk for --fast.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data.')
+
     def handle(self, *args, **options):
-        ratio = options['ratio']
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+            Faker.seed(options['seed'])
+        if options['fast']:
+            self.fast_fill(options)
+        else:
+            self.fill(options['ratio'])
+
+    def update_derived(self, questions, answers, first_question_id):
+        print('Updating answer counts...')
+        questions.recount_answers()
+
+        print('Updating question ratings...')
+        questions.recount_rating()
+
+        print('Updating answer ratings...')
+        answers.recount_rating()
+
+        print('Updating user reputation...')
+        reputation.recount(User.objects.all())
+
+        print('Updating hot scores...')
+        ranking.refresh_window()
+
+        print('Updating tag feeds...')
+        feeds.rebuild(first_question_id - 1)
+
+        print('Updating related questions...')
+        for _ in related.rebuild():
+            pass
+
+        print('Updating search index...')
+        for _ in search.reindex_queryset(questions):
+            pass
+
+        sidebar.invalidate_tags()
+        sidebar.invalidate_members()
+        caching.invalidate_pages()
+
+    @transaction.atomic
+    def fill(self, ratio):
         fake = Faker()
         print(f'Starting to fill database with ratio: {ratio}...')
     
@@ -99,26 +147,72 @@ class Command(BaseCommand):
             ))
         AnswerLike.objects.bulk_create(answer_likes, batch_size=5000, ignore_conflicts=True)
 
-        print('Updating question ratings...')
-        ratings_question = QuestionLike.objects.filter(
-            question=OuterRef('pk')
-        ).values('question').annotate(
-            sum_rating=Coalesce(Sum('value'), 0)
-        ).values('sum_rating')
-
-        Question.objects.filter(id__in=question_ids).update(
-            rating=Coalesce(Subquery(ratings_question), 0)
-        )
-
-        print('Updating answer ratings...')
-        ratings_answer = AnswerLike.objects.filter(
-            answer=OuterRef('pk')
-        ).values('answer').annotate(
-            sum_rating=Coalesce(Sum('value'), 0)
-        ).values('sum_rating')
-
-        Answer.objects.filter(id__in=answer_ids).update(
-            rating=Coalesce(Subquery(ratings_answer), 0)
+        self.update_derived(
+            Question.objects.filter(id__in=question_ids),
+            Answer.objects.filter(id__in=answer_ids),
+            min(question_ids, default=1),
         )
 
         print('Successfully filled the database!')
+
+    def fast_fill(self, options):
+        ratio = options['ratio']
+        workers = max(1, options['workers'])
+        chunk_size = options['chunk_size']
+        print(f'Starting to fill database with ratio: {ratio} using {workers} workers...')
+        started = time.monotonic()
+
+        # Ids are handed out up front from the current maximum, so nothing is re-read
+        # after loading. Do not run this concurrently with other writers.
+        plan = {
+            'seed': options['seed'] if options['seed'] is not None else random.randrange(2 ** 32),
+            'now': timezone.now(),
+            'password': make_password('password123'),
+            'users': ratio,
+            'tags': ratio,
+            'questions': ratio * 10,
+            'answers': ratio * 100,
+            'likes_per_user': 100,
+            'user_base': fast.next_id(User),
+            'tag_base': fast.next_id(Tag),
+            'question_base': fast.next_id(Question),
+            'answer_base': fast.next_id(Answer),
+        }
+        QuestionTag = Question.tags.through
+        steps = [
+            ('users', User, ('id', 'username', 'email', 'password'), fast.gen_users, ratio),
+            ('tags', Tag, ('id', 'name'), fast.gen_tags, ratio),
+            ('questions', Question, ('id', 'author_id', 'title', 'text', 'created_at'),
+             fast.gen_questions, ratio * 10),
+            ('question tags', QuestionTag, ('question_id', 'tag_id'), fast.gen_question_tags, ratio * 10),
+            ('answers', Answer, ('id', 'author_id', 'question_id', 'text', 'created_at'),
+             fast.gen_answers, ratio * 100),
+            ('question likes', QuestionLike, ('user_id', 'question_id', 'value'),
+             fast.gen_question_likes, ratio),
+            ('answer likes', AnswerLike, ('user_id', 'answer_id', 'value'), fast.gen_answer_likes, ratio),
+        ]
+
+        pool = fast.make_pool(workers)
+        try:
+            for label, model, columns, generator, total in steps:
+                print(f'Creating {label}...')
+                loader = fast.TableLoader(model, columns)
+                progress = fast.Progress(print, label, total)
+                # Likes are generated per user, about a hundred rows each.
+                unit_chunk = max(1, chunk_size // 100) if generator in (
+                    fast.gen_question_likes, fast.gen_answer_likes) else chunk_size
+                for units, rows in fast.stream(generator, total, unit_chunk, plan, workers, pool):
+                    loader.load(rows)
+                    progress.add(units, len(rows))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        fast.reset_sequences([User, Tag, Question, QuestionTag, Answer, QuestionLike, AnswerLike])
+        self.update_derived(
+            Question.objects.filter(id__gt=plan['question_base']),
+            Answer.objects.filter(id__gt=plan['answer_base']),
+            plan['question_base'] + 1,
+        )
+        print(f'Successfully filled the database in {time.monotonic() - started:.1f}s!')
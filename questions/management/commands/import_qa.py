@@ -0,0 +1,156 @@
+import json
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from questions.models import User, Question
+from questions import sidebar, caching, search, feeds, ranking, related, reputation
+from . import _dataset as dataset
+from . import _fast_fill as fast
+
+
+class Command(BaseCommand):
+    help = ('Loads an export_qa directory with its ids, in batches. An interrupted import is resumed '
+            'with --resume, which skips every row already in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='A directory written by export_qa.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per transaction.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue after the highest id already imported into each table.')
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='Load with the secondary indexes in place instead of rebuilding them afterwards.')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        manifest = dataset.read_manifest(directory)
+        if manifest is None:
+            raise CommandError(f'{directory} has no {dataset.MANIFEST}; run export_qa first.')
+        if manifest.get('format') != dataset.FORMAT:
+            raise CommandError(f'Unsupported export format {manifest.get("format")}.')
+        incomplete = [table for table, entry in manifest['tables'].items() if not entry['complete']]
+        if incomplete:
+            raise CommandError(f'The export is unfinished ({", ".join(incomplete)}); resume export_qa first.')
+
+        steps = []
+        for table, model in dataset.tables():
+            entry = manifest['tables'].get(table)
+            if entry is None:
+                raise CommandError(f'The export has no {table} table.')
+            unknown = set(entry['columns']) - set(dataset.columns(model))
+            if unknown:
+                raise CommandError(f'{table}: unknown columns {", ".join(sorted(unknown))}.')
+            steps.append((table, model, entry))
+        if not options['resume']:
+            filled = [table for table, model, _ in steps if model.objects.exists()]
+            if filled:
+                raise CommandError(f'{", ".join(filled)} already hold rows; import into an empty database '
+                                   'or pass --resume.')
+
+        models = [model for _, model, _ in steps]
+        started = time.monotonic()
+        if not options['keep_indexes']:
+            self.drop_indexes(models)
+
+        total = 0
+        # FK checks are skipped per row (SQLite) or deferred to each commit
+        # (PostgreSQL) and then run once per table below.
+        with connection.constraint_checks_disabled():
+            for table, model, entry in steps:
+                total += self.import_table(directory, table, model, entry, options['batch_size'])
+                connection.check_constraints(table_names=[model._meta.db_table])
+        loaded = time.monotonic() - started
+
+        if not options['keep_indexes']:
+            self.stdout.write('Rebuilding indexes...')
+            self.create_indexes(models)
+        fast.reset_sequences(models)
+        self.update_derived()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} rows in {elapsed:.1f}s '
+            f'({total / loaded if loaded else 0:,.0f} rows/s loading, {total / elapsed if elapsed else 0:,.0f} rows/s overall).'
+        ))
+
+    def import_table(self, directory, table, model, entry, batch_size):
+        columns = entry['columns']
+        # The database is the checkpoint: rows are exported in id order and
+        # every batch commits on its own, so nothing at or below the highest
+        # id present needs loading again.
+        checkpoint = fast.next_id(model)
+        remaining = sum(chunk['rows'] for chunk in entry['chunks'] if chunk['last_id'] > checkpoint)
+        if not remaining:
+            self.stdout.write(f'{table}: nothing to import')
+            return 0
+
+        loader = fast.TableLoader(model, columns)
+        progress = fast.Progress(self.stdout.write, table, remaining)
+        batch = []
+        skipped = 0
+        for chunk in entry['chunks']:
+            if chunk['last_id'] <= checkpoint:
+                continue
+            with dataset.open_chunk(os.path.join(directory, chunk['file']), 'r') as file:
+                for line in file:
+                    row = json.loads(line)
+                    if row['id'] <= checkpoint:
+                        skipped += 1
+                        continue
+                    batch.append([row[column] for column in columns])
+                    if len(batch) == batch_size:
+                        self.load(loader, batch, progress, skipped)
+                        batch, skipped = [], 0
+        if batch or skipped:
+            self.load(loader, batch, progress, skipped)
+        return progress.rows
+
+    def load(self, loader, batch, progress, skipped):
+        if batch:
+            with transaction.atomic():
+                loader.load(batch)
+        progress.add(len(batch) + skipped, len(batch))
+
+    def drop_indexes(self, models):
+        with connection.schema_editor() as editor:
+            for model in models:
+                existing = self.index_names(model)
+                for index in model._meta.indexes:
+                    if index.name in existing:
+                        editor.remove_index(model, index)
+
+    def create_indexes(self, models):
+        # Also restores anything an interrupted run left dropped.
+        with connection.schema_editor() as editor:
+            for model in models:
+                existing = self.index_names(model)
+                for index in model._meta.indexes:
+                    if index.name not in existing:
+                        editor.add_index(model, index)
+
+    def index_names(self, model):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+
+    def update_derived(self):
+        # Ratings and answer counts come with the rows; the rest is derived here.
+        self.stdout.write('Updating user reputation...')
+        reputation.recount(User.objects.all())
+
+        self.stdout.write('Updating hot scores...')
+        ranking.refresh_window()
+
+        self.stdout.write('Updating tag feeds...')
+        feeds.rebuild()
+
+        self.stdout.write('Updating related questions...')
+        for _ in related.rebuild():
+            pass
+
+        self.stdout.write('Updating search index...')
+        for _ in search.reindex_queryset(Question.objects.all()):
+            pass
+
+        sidebar.invalidate_tags()
+        sidebar.invalidate_members()
+        caching.invalidate_pages()
@@ -0,0 +1,49 @@
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from questions import listing
+from questions.models import Question
+
+
+def load_full(question_ids):
+    questions = list(Question.objects.get_full_queryset().filter(id__in=question_ids))
+    # Touch what question_item.html reads so lazy parts are paid for too.
+    for question in questions:
+        question.author.username
+        [tag.name for tag in question.tags.all()]
+    return questions
+
+
+class Command(BaseCommand):
+    help = 'Compares time and memory of full ORM listing rows with the slim listing rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100], help='Page sizes to measure.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per page size.')
+
+    def measure(self, loader, question_ids, repeat):
+        loader(question_ids)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            loader(question_ids)
+            timings.append((time.perf_counter() - started) * 1000)
+        tracemalloc.start()
+        try:
+            rows = loader(question_ids)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del rows
+        return statistics.median(timings), peak / 1024, retained / 1024
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"size":>5} {"loader":<6} {"median ms":>10} {"peak KiB":>10} {"kept KiB":>10}')
+        for size in options['sizes']:
+            question_ids = list(Question.objects.order_by(*Question.NEW_ORDERING).values_list('id', flat=True)[:size])
+            if len(question_ids) < size:
+                raise CommandError(f'Only {len(question_ids)} questions; seed more with fill_db.')
+            for name, loader in (('full', load_full), ('slim', listing.load)):
+                median, peak, retained = self.measure(loader, question_ids, options['repeat'])
+                self.stdout.write(f'{size:>5} {name:<6} {median:>10.2f} {peak:>10.1f} {retained:>10.1f}')
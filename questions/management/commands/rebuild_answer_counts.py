@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Max
+from questions.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies the denormalized Question.answer_count column.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only report questions with a wrong count.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Questions per id range.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Question.objects.aggregate(last=Max('id'))['last'] or 0
+        total = 0
+        for start in range(0, last_id + 1, batch_size):
+            batch = Question.objects.filter(id__gte=start, id__lt=start + batch_size)
+            if options['verify']:
+                total += batch.annotate(actual=Count('answer')).exclude(answer_count=F('actual')).count()
+            else:
+                with transaction.atomic():
+                    total += batch.recount_answers()
+
+        if options['verify']:
+            if total:
+                raise CommandError(f'{total} questions have a wrong answer_count.')
+            self.stdout.write(self.style.SUCCESS('All answer counts are consistent.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Recounted answers for {total} questions.'))
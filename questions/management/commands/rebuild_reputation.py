@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from questions.models import User
+from questions import reputation, sidebar
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies the denormalized reputation and activity counters of every user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only report users with wrong counters.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Users per id range.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        total = 0
+        for start in range(0, last_id + 1, batch_size):
+            batch = User.objects.filter(id__gte=start, id__lt=start + batch_size)
+            if options['verify']:
+                total += reputation.wrong(batch).count()
+            else:
+                with transaction.atomic():
+                    total += reputation.recount(batch)
+
+        if options['verify']:
+            if total:
+                raise CommandError(f'{total} users have wrong counters.')
+            self.stdout.write(self.style.SUCCESS('All user counters are consistent.'))
+        else:
+            sidebar.invalidate_members()
+            self.stdout.write(self.style.SUCCESS(f'Recounted {total} users.'))
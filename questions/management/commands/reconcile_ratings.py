@@ -0,0 +1,54 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from questions.models import Question, Answer, QuestionLike, AnswerLike, Checkpoint
+
+CHECKPOINT = 'reconcile_ratings'
+# Longer than any vote transaction: a like stamped before a run started but
+# committed after the run read past it is still picked up by the next run.
+CHECKPOINT_MARGIN = timedelta(minutes=5)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes question and answer ratings for rows voted on since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the checkpoint and recount every row.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows recounted per transaction.')
+
+    def recount(self, model, ids, batch_size):
+        total = 0
+        batch = []
+        for pk in ids:
+            batch.append(pk)
+            if len(batch) == batch_size:
+                total += self.recount_batch(model, batch)
+                batch = []
+        if batch:
+            total += self.recount_batch(model, batch)
+        return total
+
+    def recount_batch(self, model, ids):
+        with transaction.atomic():
+            return model.objects.filter(id__in=ids).recount_rating()
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        checkpoint = Checkpoint.objects.filter(name=CHECKPOINT).first()
+        since = None if options['full'] or checkpoint is None else checkpoint.reached_at
+
+        for model, like_model, field in ((Question, QuestionLike, 'question'), (Answer, AnswerLike, 'answer')):
+            if since is None:
+                ids = model.objects.order_by('id').values_list('id', flat=True)
+            else:
+                ids = like_model.objects.filter(updated_at__gte=since)\
+                    .order_by(f'{field}_id')\
+                    .values_list(f'{field}_id', flat=True)\
+                    .distinct()
+            total = self.recount(model, ids.iterator(), options['batch_size'])
+            self.stdout.write(f'Recounted {total} {model._meta.verbose_name_plural}.')
+
+        reached_at = started_at - CHECKPOINT_MARGIN
+        Checkpoint.objects.update_or_create(name=CHECKPOINT, defaults={'reached_at': reached_at})
+        self.stdout.write(self.style.SUCCESS(f'Checkpoint saved at {reached_at:%Y-%m-%d %H:%M:%S}.'))
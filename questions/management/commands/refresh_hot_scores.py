@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from questions import caching, ranking
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-decays hot scores for recent questions; run it every few minutes from cron. '
+        'Cached /hot/ pages are invalidated through the cache, so it must be shared with the web processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Questions rescored per transaction.')
+
+    def handle(self, *args, **options):
+        if not caching.is_shared():
+            self.stderr.write(self.style.WARNING(
+                'The cache is local to this process: web processes keep serving their cached /hot/ pages.'
+            ))
+        refreshed, expired = ranking.refresh_window(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored {refreshed} questions from the last {ranking.WINDOW.days} days, expired {expired}.'
+        ))
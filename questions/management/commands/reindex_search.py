@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from questions.models import Question
+from questions import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the question full-text search index in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Questions indexed per transaction.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        started = time.monotonic()
+        if not search.use_postgres():
+            total = search.fallback_index.build(chunk_size=chunk_size)
+            self.stdout.write(self.style.SUCCESS(
+                f'Built the in-process index for {total} questions in {time.monotonic() - started:.1f}s '
+                '(it only lives in this process; servers build their own on first search).'
+            ))
+            return
+
+        total = 0
+        for chunk in search.reindex_queryset(Question.objects.all(), chunk_size):
+            total += len(chunk)
+            self.stdout.write(f'  indexed {total} questions (up to id {chunk[-1]})')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} questions in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f}/s).'
+        ))
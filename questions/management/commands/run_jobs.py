@@ -0,0 +1,49 @@
+import json
+from multiprocessing import get_context
+from django.core.management.base import BaseCommand
+from django.db import connections
+from questions import jobs
+
+
+def work(batch_size, poll_interval, once):
+    worker = jobs.Worker(batch_size)
+    try:
+        worker.run(poll_interval, once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'Worker stopped: {dict(worker.stats)}')
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed at once by a worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained.')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and lag, then exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(jobs.queue_stats(), indent=2))
+            return
+
+        work_args = (options['batch_size'], options['poll_interval'], options['once'])
+        if options['workers'] <= 1:
+            work(*work_args)
+            return
+
+        # Children must open their own connections.
+        connections.close_all()
+        context = get_context('fork')
+        processes = [context.Process(target=work, args=work_args) for _ in range(options['workers'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
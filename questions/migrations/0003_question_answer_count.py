@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_answer_counts(apps, schema_editor):
+    Question = apps.get_model('questions', 'Question')
+    Answer = apps.get_model('questions', 'Answer')
+    answers = Answer.objects.filter(question=OuterRef('pk'))\
+        .order_by()\
+        .values('question')\
+        .annotate(total=Count('id'))\
+        .values('total')
+    Question.objects.update(answer_count=Coalesce(Subquery(answers), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0002_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='answer_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['answer_count', 'id'], name='question_answers_idx'),
+        ),
+        migrations.RunPython(fill_answer_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The GIN index is PostgreSQL-only, so it is kept out of Meta.indexes (SQLite
+# would try to recreate it whenever it rebuilds the table).
+INDEX_NAME = 'question_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON questions_question USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0004_vote_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0005_question_search_vector'),
+    ]
+
+    # The tag M2M uses an auto-created through table, which has no Meta to
+    # declare indexes on. (tag_id, question_id) lets /tag/<name>/ walk one
+    # tag's questions from the index alone.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX question_tags_tag_question_idx ON questions_question_tags (tag_id, question_id)',
+            'DROP INDEX question_tags_tag_question_idx',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_tag_feeds(apps, schema_editor):
+    Question = apps.get_model('questions', 'Question')
+    TagFeed = apps.get_model('questions', 'TagFeed')
+    TagLink = Question.tags.through
+    schema_editor.execute(f'''
+        INSERT INTO {TagFeed._meta.db_table} (tag_id, question_id, created_at)
+        SELECT link.tag_id, link.question_id, q.created_at
+        FROM {TagLink._meta.db_table} link
+        JOIN {Question._meta.db_table} q ON q.id = link.question_id
+    ''')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0006_question_tags_tag_question_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='questions.question')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='questions.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', 'created_at', 'question'], name='tagfeed_tag_created_idx')],
+                'unique_together': {('tag', 'question')},
+            },
+        ),
+        migrations.RunPython(fill_tag_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:47
+
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_hot_scores(apps, schema_editor):
+    # questions.ranking as of this migration: Hacker News style decay over a
+    # 7 day window, gravity 1.8, answers weighted 2.
+    window = timedelta(days=7)
+    Question = apps.get_model('questions', 'Question')
+    now = timezone.now()
+    questions = list(Question.objects.filter(created_at__gte=now - window)
+                     .only('id', 'rating', 'answer_count', 'created_at'))
+    for question in questions:
+        points = question.rating + 2 * question.answer_count
+        hours = max((now - question.created_at).total_seconds(), 0) / 3600
+        question.hot_score = points / (hours + 2) ** 1.8
+    Question.objects.bulk_update(questions, ['hot_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_tag_feed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_rating_idx',
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['hot_score', 'id'], name='question_hot_idx'),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+    ]
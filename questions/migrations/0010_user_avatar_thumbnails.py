@@ -0,0 +1,28 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_large',
+            field=models.ImageField(blank=True, editable=False, upload_to='avatars/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_small',
+            field=models.ImageField(blank=True, editable=False, upload_to='avatars/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumbs_for',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
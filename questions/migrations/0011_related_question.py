@@ -0,0 +1,26 @@
+# Generated by Django 4.2.26 on 2026-10-17 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0010_user_avatar_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('question', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='questions.question')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='questions.question')),
+            ],
+            options={
+                'unique_together': {('question', 'related')},
+            },
+        ),
+    ]
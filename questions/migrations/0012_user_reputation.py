@@ -0,0 +1,87 @@
+# Generated by Django 4.2.26 on 2026-10-17 23:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('questions', 'User')
+    Question = apps.get_model('questions', 'Question')
+    Answer = apps.get_model('questions', 'Answer')
+    questions = Question.objects.filter(author=OuterRef('pk')).order_by().values('author')
+    answers = Answer.objects.filter(author=OuterRef('pk')).order_by().values('author')
+
+    def total(queryset, aggregate):
+        return Coalesce(Subquery(queryset.annotate(total=aggregate).values('total')), 0)
+
+    question_votes = total(questions, Sum('rating'))
+    answer_votes = total(answers, Sum('rating'))
+    accepted = total(answers.filter(is_correct=True), Count('id'))
+    User.objects.update(
+        question_count=total(questions, Count('id')),
+        answer_count=total(answers, Count('id')),
+        accepted_count=accepted,
+        votes_received=question_votes + answer_votes,
+        reputation=question_votes * 5 + answer_votes * 10 + accepted * 15,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0011_related_question'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='accepted_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='answer_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='reputation',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='votes_received',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='answer',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='answer_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='question_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-reputation', 'id'], name='user_reputation_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
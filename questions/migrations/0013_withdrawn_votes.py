@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-17 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0012_user_reputation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answerlike',
+            name='value',
+            field=models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike'), (0, 'Withdrawn')]),
+        ),
+        migrations.AlterField(
+            model_name='questionlike',
+            name='value',
+            field=models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike'), (0, 'Withdrawn')]),
+        ),
+    ]
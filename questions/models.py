@@ -1,20 +1,46 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import UserManager as DefaultUserManager, AbstractUser
 from django.urls import reverse
-from django.db.models import Count
+from django.db.models import Count, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 class UserManager(DefaultUserManager):
     def best(self):
-        return self.annotate(num_answers=Count('answer')).order_by('-num_answers')[:5]
+        return self.order_by(*User.REPUTATION_ORDERING)[:5]
     
 class User(AbstractUser):
     avatar = models.ImageField(upload_to='avatars/%Y/%m/%d/', blank=True, null=True)
+    # Content-hashed thumbnails made by questions.avatars from avatar_thumbs_for.
+    avatar_small = models.ImageField(upload_to='avatars/thumbs/', blank=True, editable=False)
+    avatar_large = models.ImageField(upload_to='avatars/thumbs/', blank=True, editable=False)
+    avatar_thumbs_for = models.CharField(max_length=100, blank=True, editable=False)
+    # Kept up to date by questions.reputation.
+    reputation = models.IntegerField(default=0, editable=False)
+    question_count = models.PositiveIntegerField(default=0, editable=False)
+    answer_count = models.PositiveIntegerField(default=0, editable=False)
+    accepted_count = models.PositiveIntegerField(default=0, editable=False)
+    # Net votes on the user's questions and answers.
+    votes_received = models.IntegerField(default=0, editable=False)
 
     objects = UserManager()
 
+    REPUTATION_ORDERING = ('-reputation', 'id')
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-reputation', 'id'], name='user_reputation_idx'),
+        ]
+
     def __str__(self):
         return f"User {self.username}"
 
+    def get_session_auth_hash(self):
+        # Users built by questions.auth from the cache carry the hash, not the password.
+        if 'password' in self.get_deferred_fields() and hasattr(self, '_session_auth_hash'):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
 class TagManager(models.Manager):
     def popular(self):
         return self.annotate(num_questions=Count('question')).order_by('-num_questions')[:10]
@@ -26,51 +52,155 @@ class Tag(models.Model):
     def __str__(self):
         return f"#{self.name}"
 
-class QuestionManager(models.Manager):
+def _likes_sum(like_model, field):
+    likes = like_model.objects.filter(**{field: OuterRef('pk')})\
+        .order_by()\
+        .values(field)\
+        .annotate(total=Sum('value'))\
+        .values('total')
+    return Coalesce(Subquery(likes), 0)
+
+class QuestionQuerySet(models.QuerySet):
+    def recount_answers(self):
+        answers = Answer.objects.filter(question=OuterRef('pk'))\
+            .order_by()\
+            .values('question')\
+            .annotate(total=Count('id'))\
+            .values('total')
+        return self.update(answer_count=Coalesce(Subquery(answers), 0))
+
+    def recount_rating(self):
+        return self.update(rating=_likes_sum(QuestionLike, 'question'))
+
+class QuestionManager(models.Manager.from_queryset(QuestionQuerySet)):
     def get_full_queryset(self):
         return super().get_queryset()\
             .select_related('author')\
-            .prefetch_related('tags')\
-            .annotate(num_answers=Count('answer'))
+            .prefetch_related('tags')
     
     def new(self):
-        return self.get_full_queryset().order_by('-created_at')
+        return self.get_full_queryset().order_by(*Question.NEW_ORDERING)
 
     def hot(self):
-        return self.get_full_queryset().order_by('-rating')
+        return self.get_full_queryset().order_by(*Question.HOT_ORDERING)
+
+    def unanswered(self):
+        return self.new().filter(answer_count=0)
+
+    def most_answered(self):
+        return self.get_full_queryset().order_by(*Question.MOST_ANSWERED_ORDERING)
 
 class Question(models.Model):
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by question_author_created_idx.
+    author = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=255)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     tags = models.ManyToManyField(Tag)
     rating = models.IntegerField(default=0)
+    answer_count = models.PositiveIntegerField(default=0)
+    # Time-decayed score maintained by questions.ranking.
+    hot_score = models.FloatField(default=0, editable=False)
+    # Kept up to date by questions.search; GIN-indexed on PostgreSQL only.
+    search_vector = SearchVectorField(null=True, editable=False)
   
     objects = QuestionManager()
 
+    NEW_ORDERING = ('-created_at', '-id')
+    HOT_ORDERING = ('-hot_score', '-id')
+    MOST_ANSWERED_ORDERING = ('-answer_count', '-id')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='question_created_idx'),
+            models.Index(fields=['hot_score', 'id'], name='question_hot_idx'),
+            models.Index(fields=['answer_count', 'id'], name='question_answers_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='question_author_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} (by {self.author.username})"
 
     def get_absolute_url(self):
         return reverse('question', kwargs={'question_id': self.pk})
 
+class TagFeed(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    ORDERING = ('-created_at', '-question_id')
+
+    class Meta:
+        unique_together = ('tag', 'question')
+        indexes = [
+            models.Index(fields=['tag', 'created_at', 'question'], name='tagfeed_tag_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.tag_id} -> {self.question_id}"
+
+class RelatedQuestion(models.Model):
+    # Top questions by tag overlap, written by questions.related.
+    # Covered by the unique index, which starts with it.
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='+', db_index=False)
+    related = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    ORDERING = ('-score', '-related_id')
+
+    class Meta:
+        # Also what the question page reads through.
+        unique_together = ('question', 'related')
+
+    def __str__(self):
+        return f"#{self.question_id} ~ #{self.related_id} ({self.score:.3f})"
+
+class AnswerQuerySet(models.QuerySet):
+    def recount_rating(self):
+        return self.update(rating=_likes_sum(AnswerLike, 'answer'))
+
 class Answer(models.Model):
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by answer_author_created_idx.
+    author = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_correct = models.BooleanField(default=False)
     rating = models.IntegerField(default=0)
 
+    objects = AnswerQuerySet.as_manager()
+
+    ORDERING = ('-created_at', '-id')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', 'created_at', 'id'], name='answer_question_created_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='answer_author_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The post_save handlers update Question.answer_count and the author's
+        # counters; one transaction keeps them with the row. Deletes already
+        # send post_delete inside the deletion's transaction.
+        using = kwargs.get('using') or router.db_for_write(Answer, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Answer to '{self.question.title}' (by {self.author.username})"
 
 
+# A withdrawn vote keeps its row with value 0, so its updated_at still tells
+# reconcile_ratings which targets changed.
+LIKE_VALUES = [(1, 'Like'), (-1, 'Dislike'), (0, 'Withdrawn')]
+
+
 class QuestionLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    value = models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike')])
+    value = models.SmallIntegerField(choices=LIKE_VALUES)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'question')
@@ -78,7 +208,43 @@ class QuestionLike(models.Model):
 class AnswerLike(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     answer = models.ForeignKey(Answer, on_delete=models.CASCADE)
-    value = models.SmallIntegerField(choices=[(1, 'Like'), (-1, 'Dislike')])
+    value = models.SmallIntegerField(choices=LIKE_VALUES)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'answer')
+
+class Checkpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    reached_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.reached_at}"
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    # Identical pending jobs share a key and are stored once.
+    key = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='pending'), name='job_pending_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
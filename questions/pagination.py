@@ -0,0 +1,169 @@
+from datetime import datetime
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+COUNT_TIMEOUT = 60
+TOKEN_SALT = 'questions.pagination'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def _flip(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def _seek(ordering, values):
+    # (a, b) "after" (x, y) in the given ordering: a > x OR (a = x AND b > y).
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev.lstrip('-'): value})
+        condition |= step
+    # The redundant bound on the leading column gives the planner an index
+    # range to start from; the OR alone would be applied as a filter.
+    first = ordering[0]
+    bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+    return bound & condition
+
+
+class KeysetPage:
+    def __init__(self, rows, number, num_pages, ordering, has_next, has_previous, hydrate=None):
+        self.number = number
+        self.num_pages = max(num_pages, number)
+        self._has_next = has_next and bool(rows)
+        self._has_previous = has_previous and bool(rows)
+        # Cursor keys come from the rows that were paged over, which may not
+        # be the objects shown (see KeysetPaginator's hydrate).
+        self._first_keys = self._keys(rows[0], ordering) if rows else None
+        self._last_keys = self._keys(rows[-1], ordering) if rows else None
+        self.object_list = hydrate(rows) if hydrate else rows
+
+    @staticmethod
+    def _keys(row, ordering):
+        return [_encode(getattr(row, field.lstrip('-'))) for field in ordering]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    @staticmethod
+    def _token(keys, number, direction):
+        return signing.dumps({'n': number, 'k': keys, 'd': direction}, salt=TOKEN_SALT, compress=True)
+
+    @property
+    def next_token(self):
+        if self._has_next:
+            return self._token(self._last_keys, self.number + 1, 'next')
+        return ''
+
+    @property
+    def previous_token(self):
+        if self._has_previous:
+            return self._token(self._first_keys, self.number - 1, 'prev')
+        return ''
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page, count_key, hydrate=None, count=None):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.count_key = count_key
+        self.hydrate = hydrate
+        # A count the caller keeps itself, e.g. a denormalized counter.
+        self.known_count = count
+
+    def _page(self, rows, number, num_pages, has_next, has_previous):
+        return KeysetPage(rows, number, num_pages, self.ordering, has_next, has_previous, self.hydrate)
+
+    @property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return cache.get_or_set(f'pagination:count:{self.count_key}', self.queryset.count, COUNT_TIMEOUT)
+
+    @property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    def page(self, number=None, cursor=None):
+        if cursor:
+            try:
+                token = signing.loads(cursor, salt=TOKEN_SALT)
+                values = self._cursor_values(token['k'])
+                return self._seek_page(int(token['n']), values, token['d'] == 'prev')
+            except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+                pass
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        return self._offset_page(min(max(number, 1), self.num_pages))
+
+    def _cursor_values(self, keys):
+        # Signed, but possibly issued by a listing with another ordering.
+        if len(keys) != len(self.ordering):
+            raise ValueError('The cursor does not match this ordering.')
+        values = []
+        for field, key in zip(self.ordering, keys):
+            value = _decode(key)
+            try:
+                model_field = self.queryset.model._meta.get_field(field.lstrip('-'))
+            except FieldDoesNotExist:
+                # An annotation, e.g. the search rank.
+                values.append(value)
+            else:
+                values.append(model_field.to_python(value))
+        return values
+
+    def _seek_page(self, number, values, backwards):
+        ordering = _flip(self.ordering) if backwards else self.ordering
+        rows = list(self.queryset.filter(_seek(ordering, values)).order_by(*ordering)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return self._page(rows, max(number, 1), self.num_pages, True, more)
+        return self._page(rows, max(number, 1), self.num_pages, more, True)
+
+    def _offset_page(self, number):
+        num_pages = self.num_pages
+        offset = (number - 1) * self.per_page
+        # Pages past the middle are read backwards from the end of the index.
+        tail = self.count - offset - self.per_page
+        if number > 1 and tail < offset:
+            rows = list(self.queryset.order_by(*_flip(self.ordering))[max(tail, 0):tail + self.per_page])
+            rows.reverse()
+            return self._page(rows, number, num_pages, tail > 0, True)
+        rows = list(self.queryset.order_by(*self.ordering)[offset:offset + self.per_page + 1])
+        more = len(rows) > self.per_page
+        return self._page(rows[:self.per_page], number, num_pages, more, number > 1)
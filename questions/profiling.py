@@ -0,0 +1,241 @@
+import bisect
+import copy
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+
+# Collects (sql, seconds) for every query, on whichever thread runs it.
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.queries.append((sql, duration))
+
+    def reset(self):
+        with self._lock:
+            self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def _attach(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self._attach, weak=False, dispatch_uid=id(self))
+        for connection in connections.all():
+            self._attach(connection)
+
+    def uninstall(self):
+        connection_created.disconnect(dispatch_uid=id(self))
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+_current = ContextVar('request_profile', default=None)
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+METRICS = ('total_ms', 'view_ms', 'render_ms', 'sidebar_ms', 'sql_ms', 'sql_count')
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = []
+        self.sections = defaultdict(float)
+        self.view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+    def repeated_queries(self, threshold):
+        counts = Counter(sql for sql, _ in self.queries)
+        return [{'sql': sql, 'count': count} for sql, count in counts.most_common() if count >= threshold]
+
+
+@contextmanager
+def section(name):
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += (time.perf_counter() - started) * 1000
+
+
+class ProfilingTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with section('render'):
+            return self.template.render(context, request)
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return ProfilingTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfilingTemplate(super().get_template(template_name))
+
+
+class Histograms:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+
+    def add(self, url_name, values):
+        with self._lock:
+            view = self.views.setdefault(url_name, {
+                'requests': 0,
+                **{metric: {'sum': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)} for metric in METRICS},
+            })
+            view['requests'] += 1
+            for metric in METRICS:
+                value = values[metric]
+                view[metric]['sum'] += value
+                view[metric]['buckets'][bisect.bisect_left(BUCKETS_MS, value)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'buckets': list(BUCKETS_MS) + ['+Inf'],
+                'views': copy.deepcopy(self.views),
+            }
+
+
+histograms = Histograms()
+slow_log = logging.getLogger('questions.slow_requests')
+
+
+def _profile_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def _attach(connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'PROFILING_SLOW_REQUEST_MS', 500)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.repeat_threshold = getattr(settings, 'PROFILING_REPEATED_QUERY_THRESHOLD', 3)
+        # Attached to every connection, on every thread, for good: async views
+        # query from worker threads, which a per-request wrapper would miss.
+        # The profile of the running request comes from the context.
+        connection_created.connect(_attach, dispatch_uid='questions.profiling')
+        for connection in connections.all():
+            _attach(connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile, started)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, profile, started)
+        return response
+
+    def record(self, request, response, profile, started):
+        finished = time.perf_counter()
+        match = request.resolver_match
+        values = {
+            'total_ms': (finished - started) * 1000,
+            'view_ms': (finished - profile.view_started) * 1000 if profile.view_started else 0.0,
+            'render_ms': profile.sections['render'],
+            'sidebar_ms': profile.sections['sidebar'],
+            'sql_ms': sum(duration for _, duration in profile.queries),
+            'sql_count': len(profile.queries),
+        }
+        histograms.add(match.view_name if match else 'unresolved', values)
+        if values['total_ms'] >= self.slow_ms and random.random() < self.sample_rate:
+            self.log_slow(request, response, profile, values)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # Used under ASGI, so marking the time costs no trip through a thread.
+        profile = _current.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def log_slow(self, request, response, profile, values):
+        slowest = sorted(profile.queries, key=lambda query: query[1], reverse=True)[:5]
+        slow_log.warning(json.dumps({
+            'path': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            **{name: round(value, 2) for name, value in values.items()},
+            'repeated_queries': profile.repeated_queries(self.repeat_threshold),
+            'slowest_queries': [{'sql': sql, 'ms': round(ms, 2)} for sql, ms in slowest],
+        }))
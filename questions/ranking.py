@@ -0,0 +1,69 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Question
+from . import caching, jobs
+
+# Hacker News style decay: points / (age in hours + 2) ^ GRAVITY.
+GRAVITY = 1.8
+ANSWER_WEIGHT = 2
+# Older questions drop off /hot/ with their score pinned to 0, so the
+# periodic refresh only ever has to visit this window.
+WINDOW = timedelta(days=7)
+# Votes on a question within this many seconds share one recompute.
+COALESCE_SECONDS = 5
+
+
+def hot_score(rating, answer_count, created_at, now):
+    age = now - created_at
+    if age >= WINDOW:
+        return 0.0
+    points = rating + ANSWER_WEIGHT * answer_count
+    hours = max(age.total_seconds(), 0) / 3600
+    return points / (hours + 2) ** GRAVITY
+
+
+def refresh(question_ids, now=None):
+    now = now or timezone.now()
+    questions = Question.objects.filter(id__in=question_ids).only('id', 'rating', 'answer_count', 'created_at')
+    changed = []
+    for question in questions:
+        question.hot_score = hot_score(question.rating, question.answer_count, question.created_at, now)
+        changed.append(question)
+    Question.objects.bulk_update(changed, ['hot_score'])
+    if changed:
+        caching.invalidate_hot()
+    return len(changed)
+
+
+def refresh_window(batch_size=1000, now=None):
+    now = now or timezone.now()
+    cutoff = now - WINDOW
+    total = 0
+    ids = Question.objects.filter(created_at__gte=cutoff).order_by('id').values_list('id', flat=True)
+    batch = []
+    for question_id in ids.iterator(chunk_size=batch_size):
+        batch.append(question_id)
+        if len(batch) == batch_size:
+            with transaction.atomic():
+                total += refresh(batch, now)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            total += refresh(batch, now)
+    # Read through the score index: only questions that still have a score.
+    expired = Question.objects.filter(Q(hot_score__gt=0) | Q(hot_score__lt=0), created_at__lt=cutoff)\
+        .update(hot_score=0)
+    if expired:
+        caching.invalidate_hot()
+    return total, expired
+
+
+@jobs.handler('refresh_hot_score')
+def refresh_job(batch):
+    refresh({question_id for question_id, in batch})
+
+
+def question_changed(question_id):
+    jobs.enqueue('refresh_hot_score', question_id, delay=COALESCE_SECONDS)
@@ -0,0 +1,138 @@
+import math
+from django.db import transaction
+from django.db.models import Count, Max
+from .models import Question, RelatedQuestion
+from . import caching, jobs
+
+LIMIT = 5
+CHUNK_SIZE = 2000
+# Tags on more than this share of the questions say little about how two
+# questions relate, and would make every product row dense.
+STOP_FRACTION = 0.05
+STOP_MIN = 100
+# Tag edits within this many seconds share one refresh.
+COALESCE_SECONDS = 30
+
+TagLink = Question.tags.through
+
+
+def _tag_weights(tag_ids=None):
+    # Inverse document frequency, 0 for stop tags.
+    total = Question.objects.count()
+    stop = max(STOP_FRACTION * total, STOP_MIN)
+    links = TagLink.objects.order_by()
+    if tag_ids is not None:
+        links = links.filter(tag_id__in=tag_ids)
+    counts = links.values_list('tag_id').annotate(count=Count('id'))
+    return {tag_id: math.log(total / count) if count <= stop else 0.0 for tag_id, count in counts}
+
+
+def _rank(links, weights, targets, chunk_size):
+    # links: (question_id, tag_id) for every question that can appear, with
+    # all of its tags. Yields (question_id, related_id, score) rows, a chunk
+    # of targets at a time, by cosine similarity of the weighted tag vectors.
+    import numpy as np
+    from scipy import sparse
+
+    if not links:
+        return
+    question_ids, tag_ids = (np.array(column, dtype=np.int64) for column in zip(*links))
+    questions, rows = np.unique(question_ids, return_inverse=True)
+    tags, columns = np.unique(tag_ids, return_inverse=True)
+    values = np.array([weights.get(int(tag_id), 0.0) for tag_id in tags])[columns]
+    matrix = sparse.csr_matrix((values, (rows, columns)), shape=(len(questions), len(tags)))
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms) @ matrix
+    transposed = matrix.T.tocsr()
+
+    positions = np.flatnonzero(np.isin(questions, np.fromiter(targets, dtype=np.int64)))
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        scores = (matrix[chunk] @ transposed).tocsr()
+        result = []
+        for row, position in enumerate(chunk):
+            begin, end = scores.indptr[row], scores.indptr[row + 1]
+            related, similarity = scores.indices[begin:end], scores.data[begin:end]
+            keep = related != position
+            # Rounded so that float noise does not break ties.
+            related, similarity = related[keep], np.round(similarity[keep], 6)
+            if len(related) > LIMIT:
+                # Everything tied with the last place, so the sort picks among them.
+                cutoff = np.partition(similarity, -LIMIT)[-LIMIT]
+                keep = similarity >= cutoff
+                related, similarity = related[keep], similarity[keep]
+            # Best first; among equals the newer question.
+            order = np.lexsort((-questions[related], -similarity))[:LIMIT]
+            question_id = int(questions[position])
+            result += [
+                (question_id, int(questions[related[index]]), float(similarity[index])) for index in order
+            ]
+        yield [int(question_id) for question_id in questions[chunk]], result
+
+
+def _store(question_ids, rows):
+    with transaction.atomic():
+        RelatedQuestion.objects.filter(question_id__in=question_ids).delete()
+        RelatedQuestion.objects.bulk_create(
+            [RelatedQuestion(question_id=question_id, related_id=related_id, score=score)
+             for question_id, related_id, score in rows],
+            batch_size=5000,
+        )
+        # Only the question pages show related questions; listings are untouched.
+        caching.invalidate_questions(question_ids)
+
+
+def rebuild(chunk_size=CHUNK_SIZE):
+    # Rows older than this run belong to questions that no longer have tags.
+    stale_below = (RelatedQuestion.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    weights = _tag_weights()
+    links = list(TagLink.objects.order_by().values_list('question_id', 'tag_id').iterator(chunk_size=10000))
+    targets = {question_id for question_id, _ in links}
+    total = 0
+    for question_ids, rows in _rank(links, weights, targets, chunk_size):
+        _store(question_ids, rows)
+        total += len(question_ids)
+        yield total
+    stale = RelatedQuestion.objects.filter(id__lt=stale_below)
+    with transaction.atomic():
+        caching.invalidate_questions(set(stale.values_list('question_id', flat=True)))
+        stale.delete()
+
+
+def refresh(question_ids, chunk_size=CHUNK_SIZE):
+    # Redoes the changed questions' lists and the lists they appear in. A
+    # question they newly overlap with keeps its old list until a rebuild.
+    question_ids = set(question_ids)
+    targets = question_ids | set(
+        RelatedQuestion.objects.filter(related_id__in=question_ids).values_list('question_id', flat=True)
+    )
+    target_tags = set(TagLink.objects.filter(question_id__in=targets).values_list('tag_id', flat=True))
+    useful = [tag_id for tag_id, weight in _tag_weights(target_tags).items() if weight]
+    candidates = TagLink.objects.filter(tag_id__in=useful).values('question_id')
+    links = list(TagLink.objects.filter(question_id__in=candidates).values_list('question_id', 'tag_id'))
+    weights = _tag_weights({tag_id for _, tag_id in links})
+    done = set()
+    for chunk, rows in _rank(links, weights, targets, chunk_size):
+        _store(chunk, rows)
+        done.update(chunk)
+    # Questions left without useful tags.
+    if targets - done:
+        _store(targets - done, [])
+
+
+def for_question(question_id):
+    return list(
+        RelatedQuestion.objects.filter(question_id=question_id).order_by(*RelatedQuestion.ORDERING)
+        .select_related('related').only('related', 'related__title', 'related__answer_count')[:LIMIT]
+    )
+
+
+@jobs.handler('refresh_related')
+def refresh_job(batch):
+    refresh({question_id for question_id, in batch})
+
+
+def question_changed(question_id):
+    jobs.enqueue('refresh_related', question_id, delay=COALESCE_SECONDS)
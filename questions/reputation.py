@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import User, Question, Answer
+from . import sidebar
+
+# Points per net vote on a question and on an answer, and per accepted answer.
+QUESTION_VOTE = 5
+ANSWER_VOTE = 10
+ACCEPTED = 15
+
+
+def _change(user_id, reputation=0, votes_received=0, **counters):
+    updates = {
+        # Floored like Question.answer_count, in case a rebuild got there first.
+        name: Greatest(F(name) + delta, Value(0)) if delta < 0 else F(name) + delta
+        for name, delta in counters.items() if delta
+    }
+    if votes_received:
+        updates['votes_received'] = F('votes_received') + votes_received
+    if reputation:
+        updates['reputation'] = F('reputation') + reputation
+    if updates:
+        User.objects.filter(pk=user_id).update(**updates)
+    if reputation:
+        # After commit: a rollback must not leave the delta in the cached
+        # ranking, and the sidebar lock is not waited for holding row locks.
+        transaction.on_commit(lambda: sidebar.member_changed(user_id, reputation))
+
+
+def question_created(user_id):
+    _change(user_id, question_count=1)
+
+
+def question_deleted(user_id, rating):
+    _change(user_id, -rating * QUESTION_VOTE, -rating, question_count=-1)
+
+
+def answer_created(user_id, is_correct):
+    _change(user_id, ACCEPTED * is_correct, answer_count=1, accepted_count=int(is_correct))
+
+
+def answer_deleted(user_id, rating, is_correct):
+    _change(user_id, -rating * ANSWER_VOTE - ACCEPTED * is_correct, -rating,
+            answer_count=-1, accepted_count=-int(is_correct))
+
+
+def accepted_changed(user_id, is_correct):
+    delta = 1 if is_correct else -1
+    _change(user_id, delta * ACCEPTED, accepted_count=delta)
+
+
+def vote_received(user_id, points, delta):
+    _change(user_id, delta * points, delta)
+
+
+def _total(queryset, aggregate):
+    return Coalesce(Subquery(queryset.annotate(total=aggregate).values('total')), 0)
+
+
+def expressions():
+    # Every stored counter, recomputed from the questions and answers.
+    questions = Question.objects.filter(author=OuterRef('pk')).order_by().values('author')
+    answers = Answer.objects.filter(author=OuterRef('pk')).order_by().values('author')
+    question_votes = _total(questions, Sum('rating'))
+    answer_votes = _total(answers, Sum('rating'))
+    accepted = _total(answers.filter(is_correct=True), Count('id'))
+    return {
+        'question_count': _total(questions, Count('id')),
+        'answer_count': _total(answers, Count('id')),
+        'accepted_count': accepted,
+        'votes_received': question_votes + answer_votes,
+        'reputation': question_votes * QUESTION_VOTE + answer_votes * ANSWER_VOTE + accepted * ACCEPTED,
+    }
+
+
+def recount(users):
+    return users.update(**expressions())
+
+
+def wrong(users):
+    actual = {f'actual_{name}': expression for name, expression in expressions().items()}
+    condition = Q()
+    for name in actual:
+        condition |= ~Q(**{name[len('actual_'):]: F(name)})
+    return users.annotate(**actual).filter(condition)
@@ -0,0 +1,101 @@
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ROUTED_APPS = {'questions'}
+# Bookkeeping rows no page reads back, so writing them does not pin a client
+# to the primary. Other apps (sessions) are not routed at all.
+UNPINNED_MODELS = {'questions.job', 'questions.checkpoint'}
+PIN_COOKIE = 'db_pinned'
+
+# Only requests that went through ReplicaRoutingMiddleware read from a replica;
+# management commands, shells and workers always use the primary.
+_current = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        state = _current.get()
+        aliases = replicas()
+        if state is None or state.pinned or state.wrote or not aliases:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see its writes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS:
+            return None
+        state = _current.get()
+        if state is not None and model._meta.label_lower not in UNPINNED_MODELS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.stickiness = getattr(settings, 'REPLICA_STICKINESS_SECONDS', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        # Unsafe methods and clients that wrote recently stay on the primary,
+        # so nobody reads a replica that has not caught up with their own writes.
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or PIN_COOKIE in request.COOKIES
+        return RoutingState(pinned)
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.stickiness, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        # Views' sync_to_async threads copy the context, so they share the state.
+        state = self.start(request)
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(state, response)
@@ -0,0 +1,192 @@
+import re
+import threading
+from collections import defaultdict
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.db.models.functions import Cast
+from .models import Tag, Question, Answer
+from . import caching, jobs
+
+SEARCH_CONFIG = 'english'
+# Same relative weights PostgreSQL uses for the A/B/C labels.
+WEIGHTS = {'title': 1.0, 'tags': 1.0, 'text': 0.4, 'answers': 0.2}
+# The fallback index only returns this many best matches; search_questions
+# reports when it did.
+FALLBACK_LIMIT = 200
+# Ranks are compared and put in cursors as whole millionths: float ranks lose
+# precision through the JSON cursor, so the seek skipped or repeated rows.
+RANK_SCALE = 1000000
+# Edits to a question within this many seconds share one reindex.
+COALESCE_SECONDS = 5
+ORDERING = ('-rank', '-id')
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def update_search_vectors(question_ids):
+    question_ids = list(question_ids)
+    if not question_ids:
+        return
+    tag_link = Question.tags.through._meta
+    sql = f'''
+        UPDATE {Question._meta.db_table} q SET search_vector =
+            setweight(to_tsvector(%(config)s, q.title), 'A') ||
+            setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(t.name, ' ')
+                FROM {Tag._meta.db_table} t
+                JOIN {tag_link.db_table} qt ON qt.tag_id = t.id
+                WHERE qt.question_id = q.id
+            ), '')), 'A') ||
+            setweight(to_tsvector(%(config)s, q.text), 'B') ||
+            setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(a.text, ' ')
+                FROM {Answer._meta.db_table} a
+                WHERE a.question_id = q.id
+            ), '')), 'C')
+        WHERE q.id = ANY(%(ids)s)
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'config': SEARCH_CONFIG, 'ids': question_ids})
+
+
+# In-process fallback for databases without full-text search (SQLite in
+# development and tests). Each process keeps its own copy.
+class InvertedIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.lock = threading.Lock()
+        self.built = False
+
+    def _fields(self, question_ids=None, chunk_size=2000):
+        questions = Question.objects.order_by('id')
+        tag_links = Question.tags.through.objects.order_by('question_id')
+        answers = Answer.objects.order_by('question_id')
+        if question_ids is not None:
+            questions = questions.filter(id__in=question_ids)
+            tag_links = tag_links.filter(question_id__in=question_ids)
+            answers = answers.filter(question_id__in=question_ids)
+        documents = defaultdict(lambda: defaultdict(float))
+        streams = (
+            ('title', questions.values_list('id', 'title')),
+            ('text', questions.values_list('id', 'text')),
+            ('tags', tag_links.values_list('question_id', 'tag__name')),
+            ('answers', answers.values_list('question_id', 'text')),
+        )
+        for field, rows in streams:
+            for question_id, text in rows.iterator(chunk_size=chunk_size):
+                for token in tokenize(text):
+                    documents[question_id][token] += WEIGHTS[field]
+        return documents
+
+    def _remove(self, question_id):
+        for token in self.documents.pop(question_id, {}):
+            postings = self.postings[token]
+            postings.pop(question_id, None)
+            if not postings:
+                del self.postings[token]
+
+    def _add(self, question_id, tokens):
+        self.documents[question_id] = dict(tokens)
+        for token, score in tokens.items():
+            self.postings[token][question_id] = score
+
+    def build(self, chunk_size=2000):
+        documents = self._fields(chunk_size=chunk_size)
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.documents = {}
+            for question_id, tokens in documents.items():
+                self._add(question_id, tokens)
+            self.built = True
+        return len(documents)
+
+    def update(self, question_ids):
+        if not self.built:
+            return
+        question_ids = set(question_ids)
+        documents = self._fields(question_ids)
+        with self.lock:
+            for question_id in question_ids:
+                self._remove(question_id)
+                if question_id in documents:
+                    self._add(question_id, documents[question_id])
+
+    def search(self, text, limit=FALLBACK_LIMIT):
+        if not self.built:
+            self.build()
+        tokens = set(tokenize(text))
+        if not tokens:
+            return []
+        with self.lock:
+            postings = sorted((self.postings.get(token, {}) for token in tokens), key=len)
+            scores = {question_id: score for question_id, score in postings[0].items()}
+            for other in postings[1:]:
+                scores = {qid: score + other[qid] for qid, score in scores.items() if qid in other}
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+
+fallback_index = InvertedIndex()
+
+
+def search_questions(text):
+    # Returns (questions annotated with rank, whether the matches were cut at FALLBACK_LIMIT).
+    queryset = Question.objects.only('id')
+    if not text.strip():
+        return queryset.annotate(rank=Value(0, output_field=BigIntegerField())).none(), False
+    if use_postgres():
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        rank = Cast(SearchRank(F('search_vector'), query) * RANK_SCALE, BigIntegerField())
+        return queryset.filter(search_vector=query).annotate(rank=rank), False
+    ranked = fallback_index.search(text, FALLBACK_LIMIT)
+    return queryset.filter(id__in=[question_id for question_id, _ in ranked])\
+        .annotate(rank=Case(
+            *[When(id=question_id, then=Value(round(score * RANK_SCALE))) for question_id, score in ranked],
+            default=Value(0),
+            output_field=BigIntegerField(),
+        )), len(ranked) == FALLBACK_LIMIT
+
+
+def reindex(question_ids):
+    if use_postgres():
+        update_search_vectors(question_ids)
+    else:
+        fallback_index.update(question_ids)
+    caching.invalidate_search()
+
+
+def reindex_queryset(questions, chunk_size=2000):
+    chunk = []
+    for question_id in questions.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(question_id)
+        if len(chunk) == chunk_size:
+            with transaction.atomic():
+                reindex(chunk)
+            yield chunk
+            chunk = []
+    if chunk:
+        with transaction.atomic():
+            reindex(chunk)
+        yield chunk
+
+
+@jobs.handler('reindex_search')
+def reindex_job(batch):
+    update_search_vectors({question_id for question_id, in batch})
+    caching.invalidate_search()
+
+
+def question_changed(question_id):
+    if use_postgres():
+        jobs.enqueue('reindex_search', question_id, delay=COALESCE_SECONDS)
+    else:
+        # The fallback index lives in each web process, so a worker can't update it.
+        transaction.on_commit(lambda: reindex([question_id]))
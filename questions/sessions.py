@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db, db
+from django.contrib.sessions.backends.base import UpdateError
+from . import caching, jobs
+
+
+class SessionStore(cached_db.SessionStore):
+    # Reads come from the cache. New sessions (login, the key rotated on a
+    # password change) are written through, so a process whose cache misses
+    # still finds them; later changes are written back by a job. Deletes
+    # (logout) reach the database at once. The job reads the session from the
+    # cache, so with a cache local to this process every save writes through.
+    # A marker in the cache keeps it to one queued job per session.
+    def save(self, must_create=False):
+        delay = getattr(settings, 'SESSION_WRITE_BEHIND_SECONDS', 30)
+        write_through = delay <= 0 or not caching.is_shared(settings.SESSION_CACHE_ALIAS)
+        if must_create or self.session_key is None or write_through:
+            super().save(must_create)
+            return
+        self._cache.set(self.cache_key, self._get_session(), self.get_expiry_age())
+        # Short-lived, so a job lost to a rolled back request is queued again
+        # soon; a second job while the first still waits is ignored by enqueue.
+        if self._cache.add(persist_marker(self.cache_key), True, delay * 2):
+            jobs.enqueue('persist_session', self.session_key, delay=delay)
+
+
+def persist_marker(cache_key):
+    return f'{cache_key}:persist'
+
+
+@jobs.handler('persist_session')
+def persist_job(batch):
+    for session_key, in {tuple(args) for args in batch}:
+        store = SessionStore(session_key)
+        # Cleared before the read, so a save from here on queues a new job.
+        store._cache.delete(persist_marker(store.cache_key))
+        data = store._cache.get(store.cache_key)
+        if data is None:
+            # Flushed or expired since; the database has nothing older to fix.
+            continue
+        store._session_cache = data
+        try:
+            db.SessionStore.save(store)
+        except UpdateError:
+            # Deleted by a logout after the job was queued.
+            pass
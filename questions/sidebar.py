@@ -0,0 +1,157 @@
+import time
+import uuid
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.db.models import Count, F
+from .models import Tag, User, Question
+from .profiling import section
+
+TAGS_KEY = 'sidebar:tags'
+MEMBERS_KEY = 'sidebar:reputation'
+
+TAGS_LIMIT = 10
+MEMBERS_LIMIT = 5
+# Extra ranked rows kept below the visible ones so that a few decrements
+# do not force a full recount.
+RESERVE = 10
+TIMEOUT = 60 * 15
+# A ranking update holds its lock for a few milliseconds; the timeout only
+# frees it if the holder died.
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.5
+
+
+def _build(queryset, limit):
+    items = list(queryset.order_by('-count', 'id')[:limit + RESERVE])
+    floor = items[-1]['count'] if len(items) == limit + RESERVE else 0
+    return {'items': items, 'floor': floor}
+
+
+def _build_tags():
+    return _build(Tag.objects.values('id', 'name').annotate(count=Count('question')), TAGS_LIMIT)
+
+
+def _build_members():
+    # Read off user_reputation_idx.
+    return _build(User.objects.values('id', 'username').annotate(count=F('reputation')), MEMBERS_LIMIT)
+
+
+def _dirty_key(key):
+    return f'{key}:dirty'
+
+
+def _mark_dirty(key):
+    # Set rather than deleting the ranking: a lock holder could store its
+    # stale copy right after a delete, but the flag outlives that.
+    cache.set(_dirty_key(key), uuid.uuid4().hex, TIMEOUT)
+
+
+def _get(key, builder, limit):
+    values = cache.get_many([key, _dirty_key(key)])
+    ranking = values.get(key)
+    dirty = values.get(_dirty_key(key))
+    if ranking is None or dirty is not None:
+        ranking = builder()
+        with _locked(key) as locked:
+            if locked:
+                cache.set(key, ranking, TIMEOUT)
+                # A flag set while this one was building stays for the next read.
+                if dirty is not None and cache.get(_dirty_key(key)) == dirty:
+                    cache.delete(_dirty_key(key))
+    return ranking['items'][:limit]
+
+
+def popular_tags():
+    return _get(TAGS_KEY, _build_tags, TAGS_LIMIT)
+
+
+def best_members():
+    return _get(MEMBERS_KEY, _build_members, MEMBERS_LIMIT)
+
+
+def get_sidebar(request):
+    if not hasattr(request, '_sidebar'):
+        with section('sidebar'):
+            request._sidebar = {
+                'popular_tags': popular_tags(),
+                'best_members': best_members(),
+            }
+    return request._sidebar
+
+
+@contextmanager
+def _locked(key):
+    # cache.add is atomic on a shared cache, so concurrent updates of one
+    # ranking take turns instead of overwriting each other's deltas.
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _apply(key, limit, obj_id, delta, exact_count, extra):
+    with _locked(key) as locked:
+        if not locked:
+            # Rather than lose the delta, make the next read rebuild it.
+            _mark_dirty(key)
+            return
+        _apply_locked(key, limit, obj_id, delta, exact_count, extra)
+
+
+def _apply_locked(key, limit, obj_id, delta, exact_count, extra):
+    values = cache.get_many([key, _dirty_key(key)])
+    ranking = values.get(key)
+    # Missing or about to be rebuilt anyway.
+    if ranking is None or _dirty_key(key) in values:
+        return
+    items = ranking['items']
+    item = next((i for i in items if i['id'] == obj_id), None)
+    if item is not None:
+        item['count'] += delta
+    elif delta > 0:
+        count = exact_count()
+        if count <= ranking['floor']:
+            return
+        items.append(dict(extra(), id=obj_id, count=count))
+    else:
+        return
+    items.sort(key=lambda i: (-i['count'], i['id']))
+    while len(items) > limit + RESERVE:
+        ranking['floor'] = max(ranking['floor'], items.pop()['count'])
+    if any(i['count'] < ranking['floor'] for i in items[:limit]):
+        cache.delete(key)
+    else:
+        cache.set(key, ranking, TIMEOUT)
+
+
+def tag_changed(tag_id, delta):
+    _apply(
+        TAGS_KEY, TAGS_LIMIT, tag_id, delta,
+        lambda: Question.tags.through.objects.filter(tag_id=tag_id).count(),
+        lambda: {'name': Tag.objects.values_list('name', flat=True).get(pk=tag_id)},
+    )
+
+
+def member_changed(user_id, delta):
+    _apply(
+        MEMBERS_KEY, MEMBERS_LIMIT, user_id, delta,
+        lambda: User.objects.values_list('reputation', flat=True).get(pk=user_id),
+        lambda: {'username': User.objects.values_list('username', flat=True).get(pk=user_id)},
+    )
+
+
+def invalidate_tags():
+    _mark_dirty(TAGS_KEY)
+
+
+def invalidate_members():
+    _mark_dirty(MEMBERS_KEY)
@@ -0,0 +1,152 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.contrib.auth.signals import user_logged_out
+from django.dispatch import receiver
+from .models import User, Tag, Question, Answer, QuestionLike, AnswerLike
+from . import sidebar, caching, search, feeds, ranking, avatars, auth, live, suggest, related, reputation
+
+
+@receiver(pre_save, sender=Answer)
+def answer_saving(sender, instance, update_fields=None, **kwargs):
+    # Acceptance has no write path of its own (only the admin), so note it
+    # before any save that may change it.
+    if not instance._state.adding and (update_fields is None or 'is_correct' in update_fields):
+        instance._was_correct = Answer.objects.filter(pk=instance.pk).values_list('is_correct', flat=True).first()
+
+
+@receiver(post_save, sender=Answer)
+def answer_created(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.question_id).update(answer_count=F('answer_count') + 1)
+        reputation.answer_created(instance.author_id, instance.is_correct)
+        live.publish('answer', instance.question_id, instance.pk)
+    else:
+        was_correct = instance.__dict__.pop('_was_correct', None)
+        if was_correct is not None and was_correct != instance.is_correct:
+            reputation.accepted_changed(instance.author_id, instance.is_correct)
+    caching.invalidate_question(instance.question_id, listed=created)
+    search.question_changed(instance.question_id)
+    ranking.question_changed(instance.question_id)
+
+
+@receiver(post_delete, sender=Answer)
+def answer_deleted(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id, answer_count__gt=0)\
+        .update(answer_count=F('answer_count') - 1)
+    reputation.answer_deleted(instance.author_id, instance.rating, instance.is_correct)
+    caching.invalidate_question(instance.question_id, listed=True)
+    search.question_changed(instance.question_id)
+    ranking.question_changed(instance.question_id)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        if reverse:
+            caching.invalidate_pages()
+            for question_id in pk_set or ():
+                search.question_changed(question_id)
+                related.question_changed(question_id)
+        else:
+            caching.invalidate_question(instance.pk)
+            caching.invalidate_pages()
+            search.question_changed(instance.pk)
+            related.question_changed(instance.pk)
+    # post_remove reports every requested pk, linked or not.
+    if action == 'pre_remove':
+        lookup = {'tag_id': instance.pk, 'question_id__in': pk_set} if reverse \
+            else {'question_id': instance.pk, 'tag_id__in': pk_set}
+        field = 'question_id' if reverse else 'tag_id'
+        instance._removed_tag_links = set(sender.objects.filter(**lookup).values_list(field, flat=True))
+    elif action in ('post_add', 'post_remove'):
+        if action == 'post_add':
+            delta = 1
+        else:
+            delta = -1
+            pk_set = instance.__dict__.pop('_removed_tag_links', set())
+        tag_ids, question_ids = ([instance.pk], pk_set) if reverse else (pk_set, [instance.pk])
+        if action == 'post_add':
+            feeds.add_links((tag_id, question_id) for tag_id in tag_ids for question_id in question_ids)
+        elif pk_set:
+            feeds.remove_links(tag_ids, question_ids)
+        if reverse:
+            if pk_set:
+                sidebar.tag_changed(instance.pk, delta * len(pk_set))
+        else:
+            for tag_id in pk_set:
+                sidebar.tag_changed(tag_id, delta)
+    elif action == 'post_clear':
+        if reverse:
+            feeds.remove_links(tag_ids=[instance.pk])
+        else:
+            feeds.remove_links(question_ids=[instance.pk])
+        sidebar.invalidate_tags()
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Tag)
+def tag_links_deleted(sender, instance, **kwargs):
+    sidebar.invalidate_tags()
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, created=False, **kwargs):
+    if created or kwargs['signal'] is post_delete:
+        caching.invalidate_pages()
+    caching.invalidate_question(instance.pk, listed=True)
+    search.question_changed(instance.pk)
+
+
+@receiver(post_save, sender=Question)
+def question_created(sender, instance, created, **kwargs):
+    if created:
+        reputation.question_created(instance.author_id)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    reputation.question_deleted(instance.author_id, instance.rating)
+
+
+@receiver(post_save, sender=Tag)
+def listing_changed(sender, instance, created, **kwargs):
+    caching.invalidate_pages()
+    if created:
+        suggest.tag_created(instance.pk, instance.name)
+
+
+@receiver(post_save, sender=AnswerLike)
+@receiver(post_delete, sender=AnswerLike)
+def answer_vote_changed(sender, instance, **kwargs):
+    question_id = Answer.objects.filter(pk=instance.answer_id).values_list('question_id', flat=True).first()
+    if question_id is not None:
+        caching.invalidate_question(question_id)
+        live.publish('answer_rating', question_id, instance.answer_id)
+
+
+@receiver(post_save, sender=QuestionLike)
+@receiver(post_delete, sender=QuestionLike)
+def question_vote_changed(sender, instance, **kwargs):
+    caching.invalidate_question(instance.question_id, listed=True)
+    ranking.question_changed(instance.question_id)
+    live.publish('question_rating', instance.question_id, instance.question_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    auth.forget_user(instance.pk)
+    if update_fields is None or 'avatar' in update_fields:
+        avatars.avatar_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    auth.forget_user(instance.pk)
+    sidebar.invalidate_members()
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        auth.forget_user(user.pk)
@@ -0,0 +1,154 @@
+import gzip
+import mimetypes
+import os
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.ico', '.txt', '.json', '.map', '.html'}
+# Content-Encoding -> file suffix, best first.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+
+
+def compress(path):
+    with open(path, 'rb') as file:
+        content = file.read()
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    written = []
+    for suffix, compressed in variants:
+        # Small or already dense files can come out bigger.
+        if len(compressed) < len(content):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                for compressed in compress(self.path(name)):
+                    yield name, compressed, True
+
+
+def parse_accept_encoding(header):
+    # {coding: q}; 'gzip;q=0' refuses gzip, and a malformed q counts as 0.
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+class StaticFile:
+    def __init__(self, path, name, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        # Weak: the compressed variants share it.
+        self.etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        self.last_modified = http_date(stat.st_mtime)
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+        self.variants = [
+            (encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)
+        ]
+
+    def choose(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding, path in self.variants:
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding, path
+        return None, self.path
+
+
+class StaticFilesMiddleware:
+    # Serves collectstatic output from the app itself, for deployments without
+    # a separate web server in front. Files are indexed once at startup.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_SERVE', not settings.DEBUG) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.files = self.index(settings.STATIC_ROOT)
+
+    @staticmethod
+    def index(root):
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(suffixes):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[name] = StaticFile(path, name, name in hashed)
+        return files
+
+    def find(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            return self.files.get(request.path_info[len(self.prefix):])
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        static_file = self.find(request)
+        if static_file is not None:
+            return self.serve(request, static_file)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        static_file = self.find(request)
+        if static_file is not None:
+            return self.serve(request, static_file)
+        return await self.get_response(request)
+
+    def serve(self, request, static_file):
+        if request.headers.get('If-None-Match') == static_file.etag:
+            response = HttpResponseNotModified()
+        else:
+            encoding, path = static_file.choose(request.headers.get('Accept-Encoding', ''))
+            response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            del response['Content-Disposition']
+            if encoding:
+                response['Content-Encoding'] = encoding
+            if request.method == 'HEAD':
+                response.streaming_content = []
+        response['ETag'] = static_file.etag
+        response['Last-Modified'] = static_file.last_modified
+        response['Cache-Control'] = static_file.cache_control
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        return response
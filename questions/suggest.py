@@ -0,0 +1,158 @@
+import bisect
+import heapq
+import threading
+import time
+from array import array
+from django.db import connection, transaction
+from django.db.models import Count
+from .models import Tag
+
+LIMIT = 10
+# Prefix ranges up to this long are ranked by scanning them; longer ones get
+# their top LIMIT stored at build time. That bounds both the work per lookup
+# and the stored lists (each covers a range at least this long).
+SCAN_LIMIT = 64
+# How often a lookup checks for tags created by other processes.
+REFRESH_SECONDS = 5
+# Question counts are only brought up to date by a rebuild, which also
+# happens early once this many tags were added since the last one.
+REBUILD_SECONDS = 60 * 15
+REBUILD_RECENT = 1000
+
+
+class Snapshot:
+    def __init__(self, rows):
+        # rows: (id, name, question count)
+        rows = sorted(((name.lower(), name, count, tag_id) for tag_id, name, count in rows))
+        # Most names are lowercase already; those share one string with their key.
+        rows = [(key, key if key == name else name, count, tag_id) for key, name, count, tag_id in rows]
+        self.keys = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.counts = array('q', (row[2] for row in rows))
+        self.max_id = max((row[3] for row in rows), default=0)
+        self.top = {}
+        self.built_at = time.monotonic()
+        self._rank_range(0, len(self.keys), 0)
+
+    def _rank(self, position):
+        # More questions first, then alphabetical.
+        return self.counts[position], -position
+
+    def _rank_range(self, lo, hi, depth):
+        # keys[lo:hi] share their first `depth` characters.
+        if hi - lo <= SCAN_LIMIT:
+            return heapq.nlargest(LIMIT, range(lo, hi), key=self._rank)
+        keys = self.keys
+        candidates = []
+        position = lo
+        while position < hi and len(keys[position]) == depth:
+            candidates.append(position)
+            position += 1
+        while position < hi:
+            prefix = keys[position][:depth + 1]
+            end = bisect.bisect_left(keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), position, hi)
+            candidates += self._rank_range(position, end, depth + 1)
+            position = end
+        best = heapq.nlargest(LIMIT, candidates, key=self._rank)
+        if depth:
+            self.top[keys[lo][:depth]] = array('l', best)
+        return best
+
+    def suggest(self, prefix):
+        best = self.top.get(prefix)
+        if best is None:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + '\U0010ffff', lo)
+            best = heapq.nlargest(LIMIT, range(lo, hi), key=self._rank)
+        return [(self.names[position], self.counts[position]) for position in best]
+
+
+class TagPrefixIndex:
+    # Per process, like search.fallback_index. Lookups read an immutable
+    # snapshot; tags created since it was built sit in a short sorted list.
+    def __init__(self):
+        self.snapshot = None
+        self.recent = []
+        self.lock = threading.Lock()
+        self.checked_at = 0
+        self.rebuilding = False
+
+    def build(self):
+        rows = Tag.objects.annotate(count=Count('question')).values_list('id', 'name', 'count')
+        snapshot = Snapshot(rows.iterator(chunk_size=10000))
+        with self.lock:
+            self.snapshot = snapshot
+            self.recent = [tag for tag in self.recent if tag[3] > snapshot.max_id]
+            self.checked_at = time.monotonic()
+        return len(snapshot.keys)
+
+    def _rebuild(self):
+        try:
+            self.build()
+        finally:
+            self.rebuilding = False
+            # The thread's own connection.
+            connection.close()
+
+    def _rebuild_in_background(self):
+        # Lookups keep using the old snapshot meanwhile.
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def add(self, tags):
+        # tags: (id, name) created since the snapshot.
+        with self.lock:
+            if self.snapshot is None:
+                return
+            known = {tag[3] for tag in self.recent}
+            added = [
+                (name.lower(), name, 0, tag_id) for tag_id, name in tags
+                if tag_id > self.snapshot.max_id and tag_id not in known
+            ]
+            if added:
+                self.recent = sorted(self.recent + added)
+            crowded = len(self.recent) > REBUILD_RECENT
+        if crowded:
+            self._rebuild_in_background()
+
+    def _refresh(self):
+        with self.lock:
+            self.checked_at = time.monotonic()
+            last_id = max([self.snapshot.max_id] + [tag[3] for tag in self.recent])
+        self.add(Tag.objects.filter(id__gt=last_id).values_list('id', 'name'))
+
+    def suggest(self, prefix, limit=LIMIT):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if self.snapshot is None:
+            self.build()
+        now = time.monotonic()
+        if now - self.checked_at > REFRESH_SECONDS:
+            self._refresh()
+        if now - self.snapshot.built_at > REBUILD_SECONDS:
+            self._rebuild_in_background()
+        found = self.snapshot.suggest(prefix)
+        with self.lock:
+            start = bisect.bisect_left(self.recent, (prefix,))
+            for key, name, count, _ in self.recent[start:]:
+                if not key.startswith(prefix):
+                    break
+                found.append((name, count))
+        # Stable, so recent tags rank below indexed ones with the same count.
+        found.sort(key=lambda tag: -tag[1])
+        return found[:limit]
+
+
+tag_index = TagPrefixIndex()
+
+
+def suggest_tags(prefix, limit=LIMIT):
+    return tag_index.suggest(prefix, min(limit, LIMIT))
+
+
+def tag_created(tag_id, name):
+    transaction.on_commit(lambda: tag_index.add([(tag_id, name)]))
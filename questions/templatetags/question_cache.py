@@ -0,0 +1,9 @@
+from django import template
+from questions import caching
+
+register = template.Library()
+
+
+@register.filter
+def question_version(question_id):
+    return caching.question_version(question_id)
@@ -1,3 +1,998 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+import asyncio
+import io
+import os
+import random
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from .models import User, Tag, Question, Answer, QuestionLike, AnswerLike, Job, RelatedQuestion, TagFeed
+from .routers import PIN_COOKIE, ReplicaRouter, RoutingState, _current
+from .pagination import KeysetPaginator, TOKEN_SALT
+from .management.commands._fast_fill import TableLoader
+from .staticfiles import StaticFile, parse_accept_encoding
+from .sessions import SessionStore, persist_job
+from . import avatars, caching, feeds, jobs, listing, live, ranking, related, reputation, sidebar, suggest, votes, search
 
-# Create your tests here.
+
+class KeysetPaginationTests(TestCase):
+    PER_PAGE = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pw')
+        now = timezone.now()
+        for number in range(23):
+            question = Question.objects.create(author=author, title=f'Question {number}', text='text')
+            # Pairs of questions share a timestamp, so ties fall on page boundaries.
+            Question.objects.filter(pk=question.pk).update(created_at=now - timedelta(minutes=number // 2))
+        cls.expected = list(Question.objects.order_by(*Question.NEW_ORDERING).values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def paginator(self):
+        return KeysetPaginator(Question.objects.all(), Question.NEW_ORDERING, self.PER_PAGE, 'test')
+
+    def ids(self, page):
+        return [question.id for question in page]
+
+    def test_next_cursors_visit_every_row_once(self):
+        paginator = self.paginator()
+        page = paginator.page()
+        seen = self.ids(page)
+        while page.has_next():
+            page = paginator.page(cursor=page.next_token)
+            seen += self.ids(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(page.number, 5)
+
+    def test_previous_cursors_walk_back_to_the_first_page(self):
+        paginator = self.paginator()
+        page = paginator.page(5)
+        pages = [self.ids(page)]
+        while page.has_previous():
+            page = paginator.page(cursor=page.previous_token)
+            pages.insert(0, self.ids(page))
+        self.assertEqual(page.number, 1)
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_numbered_pages_match_offsets(self):
+        paginator = self.paginator()
+        self.assertEqual(paginator.num_pages, 5)
+        for number in range(1, 6):
+            start = (number - 1) * self.PER_PAGE
+            page = paginator.page(number)
+            self.assertEqual(self.ids(page), self.expected[start:start + self.PER_PAGE])
+            self.assertEqual(page.has_next(), number < 5)
+            self.assertEqual(page.has_previous(), number > 1)
+
+    def test_out_of_range_and_invalid_numbers(self):
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(99).number, 5)
+        self.assertEqual(paginator.page(0).number, 1)
+        self.assertEqual(self.ids(paginator.page('abc')), self.expected[:self.PER_PAGE])
+
+    def test_tampered_cursor_falls_back_to_the_page_number(self):
+        paginator = self.paginator()
+        token = paginator.page().next_token
+        tampered = token[:-2] + ('AA' if not token.endswith('AA') else 'BB')
+        page = paginator.page(2, tampered)
+        self.assertEqual(page.number, 2)
+        self.assertEqual(self.ids(page), self.expected[5:10])
+
+    def test_signed_cursor_with_bad_contents_falls_back(self):
+        paginator = self.paginator()
+        for contents in ({'n': 3}, {'n': 3, 'k': ['not a date'], 'd': 'next'}, ['list']):
+            cursor = signing.dumps(contents, salt=TOKEN_SALT, compress=True)
+            self.assertEqual(self.ids(paginator.page(None, cursor)), self.expected[:self.PER_PAGE])
+
+    def test_empty_listing(self):
+        paginator = KeysetPaginator(Question.objects.none(), Question.NEW_ORDERING, self.PER_PAGE, 'empty')
+        page = paginator.page()
+        self.assertEqual(list(page), [])
+        self.assertEqual(page.number, 1)
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.next_token, '')
+
+
+class VoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.voter = User.objects.create_user('voter', password='pw')
+        cls.question = Question.objects.create(author=cls.author, title='Question', text='text')
+        cls.answer = Answer.objects.create(author=cls.author, question=cls.question, text='answer')
+
+    def setUp(self):
+        cache.clear()
+
+    def reputation(self):
+        return User.objects.get(pk=self.author.pk).reputation
+
+    def test_vote_switch_and_withdraw(self):
+        self.assertEqual(votes.vote_question(self.voter, self.question.id, 1), (1, 1))
+        self.assertEqual(self.reputation(), reputation.QUESTION_VOTE)
+        self.assertEqual(votes.vote_question(self.voter, self.question.id, -1), (-1, -1))
+        self.assertEqual(self.reputation(), -reputation.QUESTION_VOTE)
+        self.assertEqual(votes.vote_question(self.voter, self.question.id, -1), (0, 0))
+        self.assertEqual(self.reputation(), 0)
+        # The withdrawn vote keeps its row, and voting again reuses it.
+        self.assertEqual(QuestionLike.objects.get(user=self.voter).value, 0)
+        self.assertEqual(votes.vote_question(self.voter, self.question.id, 1), (1, 1))
+        self.assertEqual(QuestionLike.objects.count(), 1)
+
+    def test_answer_votes(self):
+        self.assertEqual(votes.vote_answer(self.voter, self.answer.id, 1), (1, 1))
+        self.assertEqual(self.reputation(), reputation.ANSWER_VOTE)
+        self.assertEqual(votes.vote_answer(self.voter, self.answer.id, 1), (0, 0))
+        self.assertEqual(self.reputation(), 0)
+
+    def test_unsupported_value(self):
+        with self.assertRaises(ValueError):
+            votes.vote_question(self.voter, self.question.id, 2)
+
+    def test_like_deleted_after_a_failed_insert_is_created_again(self):
+        create = QuestionLike.objects.create
+        calls = []
+
+        def racing_create(**kwargs):
+            # The first insert collides with a row that is gone by the lookup.
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise IntegrityError('duplicate key')
+            return create(**kwargs)
+
+        with mock.patch.object(QuestionLike.objects, 'create', side_effect=racing_create):
+            self.assertEqual(votes.vote_question(self.voter, self.question.id, 1), (1, 1))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(QuestionLike.objects.get(user=self.voter).value, 1)
+
+    def test_incremental_reconcile_sees_likes_committed_after_a_run(self):
+        call_command('reconcile_ratings', stdout=StringIO())
+        # Stamped just before that run started, committed after it had scanned.
+        votes.vote_question(self.voter, self.question.id, 1)
+        QuestionLike.objects.update(updated_at=timezone.now() - timedelta(seconds=2))
+        Question.objects.filter(pk=self.question.pk).update(rating=7)
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rating, 1)
+
+    def test_incremental_reconcile_sees_withdrawn_votes(self):
+        votes.vote_question(self.voter, self.question.id, 1)
+        votes.vote_answer(self.voter, self.answer.id, -1)
+        call_command('reconcile_ratings', stdout=StringIO())
+        votes.vote_question(self.voter, self.question.id, 1)
+        votes.vote_answer(self.voter, self.answer.id, -1)
+        # Drift the stored ratings; only rows voted on since the checkpoint are recounted.
+        Question.objects.filter(pk=self.question.pk).update(rating=7)
+        Answer.objects.filter(pk=self.answer.pk).update(rating=7)
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rating, 0)
+        self.assertEqual(Answer.objects.get(pk=self.answer.pk).rating, 0)
+        self.assertEqual(AnswerLike.objects.get(user=self.voter).value, 0)
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.voter = User.objects.create_user('voter', password='pw')
+        cls.listed = Question.objects.create(author=cls.author, title='Listed', text='text')
+        cls.other = Question.objects.create(author=cls.author, title='Other', text='text')
+        cls.answer = Answer.objects.create(author=cls.author, question=cls.other, text='answer')
+
+    def setUp(self):
+        cache.clear()
+        self.renders = 0
+
+        @caching.cache_anonymous_page
+        def listing(request):
+            self.renders += 1
+            caching.note_listed(request, [self.listed])
+            return HttpResponse(f'render {self.renders}')
+        self.view = listing
+
+    def get(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return self.view(request).content
+
+    def test_vote_on_a_listed_question_renders_again(self):
+        self.assertEqual(self.get(), b'render 1')
+        self.assertEqual(self.get(), b'render 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            votes.vote_question(self.voter, self.listed.id, 1)
+        self.assertEqual(self.get(), b'render 2')
+
+    def test_votes_elsewhere_keep_the_page(self):
+        self.assertEqual(self.get(), b'render 1')
+        pages_version = caching.pages_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            votes.vote_question(self.voter, self.other.id, 1)
+            votes.vote_answer(self.voter, self.answer.id, 1)
+        self.assertEqual(self.get(), b'render 1')
+        self.assertEqual(caching.pages_version(), pages_version)
+
+    def test_listing_fingerprint_follows_listed_changes_only(self):
+        fingerprint = caching.pages_fingerprint()
+        with self.captureOnCommitCallbacks(execute=True):
+            votes.vote_answer(self.voter, self.answer.id, 1)
+        self.assertEqual(caching.pages_fingerprint(), fingerprint)
+        with self.captureOnCommitCallbacks(execute=True):
+            votes.vote_question(self.voter, self.other.id, 1)
+        self.assertNotEqual(caching.pages_fingerprint()[0], fingerprint[0])
+
+    def test_hot_refresh_drops_only_hot_pages(self):
+        pages_version, hot_version = caching.pages_version(), caching.hot_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            ranking.refresh([self.listed.id])
+        self.assertEqual(caching.pages_version(), pages_version)
+        self.assertNotEqual(caching.hot_version(), hot_version)
+
+    def test_hot_fingerprint_follows_refreshes_and_time(self):
+        fingerprint = caching.hot_fingerprint()
+        with self.captureOnCommitCallbacks(execute=True):
+            ranking.refresh([self.listed.id])
+        self.assertNotEqual(caching.hot_fingerprint()[0], fingerprint[0])
+        fingerprint = caching.hot_fingerprint()
+        later = caching.time.time() + caching.HOT_BUCKET_SECONDS
+        with mock.patch.object(caching.time, 'time', return_value=later):
+            self.assertNotEqual(caching.hot_fingerprint()[0], fingerprint[0])
+
+    def test_reindex_drops_search_counts(self):
+        version = caching.search_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            search.reindex([self.listed.id])
+        self.assertNotEqual(caching.search_version(), version)
+
+    def test_new_question_renders_again(self):
+        self.assertEqual(self.get(), b'render 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(author=self.author, title='New', text='text')
+        self.assertEqual(self.get(), b'render 2')
+
+
+class TableLoaderTests(TestCase):
+    def test_keeps_the_loaded_creation_dates(self):
+        author = User.objects.create_user('author', password='pw')
+        created_at = datetime(2020, 5, 17, 12, 30, 15, 250000, tzinfo=dt_timezone.utc)
+        loader = TableLoader(Question, ('id', 'author_id', 'title', 'text', 'created_at'))
+        loader.load([(1000, author.id, 'Loaded', 'text', created_at)])
+        self.assertEqual(Question.objects.get(pk=1000).created_at, created_at)
+
+
+class SearchPaginationTests(TestCase):
+    PER_PAGE = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pw')
+        for number in range(18):
+            # Fractional weights summed in different orders give ranks a float
+            # cursor could not carry exactly; every third question ties.
+            Question.objects.create(author=author, title='needle', text=' '.join(['needle'] * (number % 6)))
+
+    def setUp(self):
+        search.fallback_index.build()
+
+    def paginator(self, queryset):
+        return KeysetPaginator(queryset, search.ORDERING, self.PER_PAGE, 'search-test')
+
+    def test_cursors_visit_every_match_once(self):
+        questions, capped = search.search_questions('needle')
+        self.assertFalse(capped)
+        expected = list(questions.order_by(*search.ORDERING).values_list('id', flat=True))
+        self.assertEqual(len(expected), 18)
+        paginator = self.paginator(questions)
+        page = paginator.page()
+        seen = [question.id for question in page]
+        while page.has_next():
+            page = paginator.page(cursor=page.next_token)
+            seen += [question.id for question in page]
+        self.assertEqual(seen, expected)
+
+    def test_capped_fallback_is_reported(self):
+        with mock.patch.object(search, 'FALLBACK_LIMIT', 5):
+            questions, capped = search.search_questions('needle')
+        self.assertTrue(capped)
+        self.assertEqual(questions.count(), 5)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    # Outside a test transaction, which would keep every read on the primary.
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def route(self, pinned=False):
+        state = RoutingState(pinned)
+        token = _current.set(state)
+        self.addCleanup(_current.reset, token)
+        return state
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_request_reads_use_a_replica_until_it_writes(self):
+        state = self.route()
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+        self.assertTrue(state.wrote)
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_pinned_requests_read_the_primary(self):
+        self.route(pinned=True)
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_bookkeeping_and_other_apps_do_not_pin(self):
+        state = self.route()
+        for model in (Job, Session):
+            self.router.db_for_write(model)
+        self.assertFalse(state.wrote)
+        self.assertIsNone(self.router.db_for_write(Session))
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+
+
+class PinCookieTests(TestCase):
+    def test_vote_pins_the_client_to_the_primary(self):
+        author = User.objects.create_user('author', password='pw')
+        question = Question.objects.create(author=author, title='Question', text='text')
+        self.client.force_login(User.objects.create_user('voter', password='pw'))
+        response = self.client.post(f'/question/{question.id}/vote/', {'value': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('author', password='pw')
+        self.question = Question.objects.create(author=self.user, title='Question', text='text')
+
+    def upload(self, content):
+        self.user.avatar.save('avatar.png', ContentFile(content), save=False)
+        User.objects.filter(pk=self.user.pk).update(avatar=self.user.avatar.name)
+
+    def png(self):
+        buffer = io.BytesIO()
+        avatars.Image.new('RGB', (120, 80), 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_thumbnails_invalidate_the_authors_questions(self):
+        self.upload(self.png())
+        version, fingerprint = caching.question_version(self.question.id), caching.pages_fingerprint()
+        with self.captureOnCommitCallbacks(execute=True):
+            names = avatars.make_thumbnails(self.user)
+        self.assertTrue(names['avatar_small'])
+        self.assertNotEqual(caching.question_version(self.question.id), version)
+        self.assertNotEqual(caching.pages_fingerprint()[0], fingerprint[0])
+
+    def assertDefaultAvatar(self, names):
+        self.assertEqual(names, {'avatar_small': '', 'avatar_large': ''})
+        # Remembered, so the job does not retry it.
+        self.assertEqual(User.objects.get(pk=self.user.pk).avatar_thumbs_for, self.user.avatar.name)
+
+    def test_not_an_image_falls_back_to_the_default(self):
+        self.upload(b'not an image')
+        self.assertDefaultAvatar(avatars.make_thumbnails(self.user))
+
+    def test_truncated_image_falls_back_to_the_default(self):
+        self.upload(self.png()[:60])
+        with self.assertLogs('questions.avatars', 'WARNING'):
+            self.assertDefaultAvatar(avatars.make_thumbnails(self.user))
+
+
+class StaticFileEncodingTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.path = os.path.join(root.name, 'main.css')
+        for suffix in ('', '.gz', '.br'):
+            with open(self.path + suffix, 'wb') as f:
+                f.write(b'body {}')
+        self.static_file = StaticFile(self.path, 'main.css', immutable=True)
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding('gzip, br;q=0.5, *;q=0'), {'gzip': 1.0, 'br': 0.5, '*': 0.0})
+        self.assertEqual(parse_accept_encoding('GZIP;q=abc, '), {'gzip': 0.0})
+        self.assertEqual(parse_accept_encoding(''), {})
+
+    def test_choose_respects_q_values(self):
+        choose = self.static_file.choose
+        self.assertEqual(choose('gzip, deflate, br'), ('br', self.path + '.br'))
+        self.assertEqual(choose('br;q=0, gzip'), ('gzip', self.path + '.gz'))
+        self.assertEqual(choose('gzip;q=0'), (None, self.path))
+        self.assertEqual(choose('*'), ('br', self.path + '.br'))
+        self.assertEqual(choose('*;q=0, identity'), (None, self.path))
+        # No substring matches.
+        self.assertEqual(choose('x-gzip-like'), (None, self.path))
+
+
+class PageRenderTests(TestCase):
+    def test_pages_render_without_collected_static_files(self):
+        author = User.objects.create_user('author', password='pw')
+        question = Question.objects.create(author=author, title='Question', text='text')
+        for path in ('/', '/hot/', f'/question/{question.id}/'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, '/askpupkin/static/css/main.css')
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = SessionStore()
+        self.store['note'] = 'first'
+        self.store.create()
+
+    def stored_note(self):
+        return Session.objects.get(session_key=self.store.session_key).get_decoded().get('note')
+
+    def test_local_cache_writes_through(self):
+        self.store['note'] = 'second'
+        self.store.save()
+        self.assertEqual(self.stored_note(), 'second')
+        self.assertFalse(Job.objects.filter(name='persist_session').exists())
+
+    def test_shared_cache_writes_behind(self):
+        self.store['note'] = 'second'
+        with mock.patch.object(caching, 'is_shared', return_value=True):
+            self.store.save()
+        self.assertEqual(self.stored_note(), 'first')
+        self.assertTrue(Job.objects.filter(name='persist_session', args=[self.store.session_key]).exists())
+
+    def test_shared_cache_queues_one_job_until_it_runs(self):
+        with mock.patch.object(caching, 'is_shared', return_value=True), \
+                mock.patch.object(jobs, 'enqueue') as enqueue:
+            for note in ('second', 'third'):
+                self.store['note'] = note
+                self.store.save()
+            self.assertEqual(enqueue.call_count, 1)
+            persist_job([[self.store.session_key]])
+            self.assertEqual(self.stored_note(), 'third')
+            self.store['note'] = 'fourth'
+            self.store.save()
+            self.assertEqual(enqueue.call_count, 2)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.dict(jobs.handlers, {'make_tags': self.make_tags})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_tags(self, arg_lists):
+        self.calls.append(arg_lists)
+        for name, in arg_lists:
+            Tag.objects.create(name=name)
+            if name.startswith('bad'):
+                raise ValueError(name)
+
+    def test_enqueue_stores_identical_pending_jobs_once(self):
+        jobs.enqueue('make_tags', 'python')
+        jobs.enqueue('make_tags', 'python')
+        jobs.enqueue('make_tags', 'django')
+        self.assertEqual(sorted(Job.objects.values_list('key', flat=True)), ['make_tags:["django"]', 'make_tags:["python"]'])
+        # A running job does not stop the same work from being queued again.
+        Job.objects.filter(key='make_tags:["python"]').update(status=Job.RUNNING)
+        jobs.enqueue('make_tags', 'python')
+        self.assertEqual(Job.objects.filter(key='make_tags:["python"]').count(), 2)
+
+    def test_claim_takes_due_pending_jobs(self):
+        jobs.enqueue('make_tags', 'python')
+        jobs.enqueue('make_tags', 'later', delay=60)
+        worker = jobs.Worker()
+        claimed = worker.claim()
+        self.assertEqual([job.args for job in claimed], [['python']])
+        job = Job.objects.get(id=claimed[0].id)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertIsNotNone(job.locked_at)
+        self.assertEqual(worker.claim(), [])
+
+    def test_expired_lease_is_released(self):
+        jobs.enqueue('make_tags', 'python')
+        jobs.enqueue('make_tags', 'django')
+        worker = jobs.Worker()
+        worker.claim()
+        Job.objects.filter(args=['python']).update(locked_at=timezone.now() - jobs.LEASE - timedelta(seconds=1))
+        self.assertEqual(worker.release_stale(), 1)
+        stale = Job.objects.get(args=['python'])
+        self.assertEqual((stale.status, stale.attempts), (Job.PENDING, 1))
+        self.assertIsNone(stale.locked_at)
+        self.assertEqual(Job.objects.get(args=['django']).status, Job.RUNNING)
+
+    def test_failed_job_backs_off_then_gives_up(self):
+        jobs.enqueue('make_tags', 'bad')
+        worker = jobs.Worker()
+        with self.assertLogs('questions.jobs', 'ERROR'):
+            worker.run_once()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('ValueError: bad', job.last_error)
+        self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), 2, delta=1)
+        self.assertFalse(Tag.objects.exists())
+        self.assertEqual(worker.run_once(), 0)
+
+        Job.objects.update(attempts=jobs.MAX_ATTEMPTS - 1, run_after=timezone.now())
+        with self.assertLogs('questions.jobs', 'ERROR'):
+            worker.run_once()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertEqual(worker.stats['failed'], 1)
+
+    def test_failing_job_does_not_fail_its_batch(self):
+        for name in ('python', 'bad', 'django'):
+            jobs.enqueue('make_tags', name)
+        worker = jobs.Worker()
+        with self.assertLogs('questions.jobs', 'WARNING'):
+            self.assertEqual(worker.run_once(), 3)
+        self.assertEqual(len(self.calls[0]), 3)
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)), ['django', 'python'])
+        job = Job.objects.get()
+        self.assertEqual((job.args, job.attempts, job.status), (['bad'], 1, Job.PENDING))
+        self.assertEqual(worker.stats['done'], 2)
+
+    def test_run_jobs_once_drains_queue(self):
+        jobs.enqueue('make_tags', 'python')
+        jobs.enqueue('make_tags', 'django')
+        with redirect_stdout(StringIO()) as out:
+            call_command('run_jobs', '--once', '--batch-size', '1')
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.calls, [[['python']], [['django']]])
+        self.assertIn("'done': 2", out.getvalue())
+
+
+class RelatedQuestionsTests(TestCase):
+    def test_store_bumps_question_versions_once_per_chunk(self):
+        author = User.objects.create_user('author', password='pw')
+        questions = [Question.objects.create(author=author, title=f'Question {n}', text='text') for n in range(3)]
+        versions = caching.question_versions(question.id for question in questions)
+        pages_version, fingerprint = caching.pages_version(), caching.pages_fingerprint()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            related._store([question.id for question in questions], [])
+        self.assertEqual(len(callbacks), 1)
+        new_versions = caching.question_versions(question.id for question in questions)
+        self.assertTrue(all(new_versions[key] != versions[key] for key in versions))
+        self.assertEqual(caching.pages_version(), pages_version)
+        self.assertEqual(caching.pages_fingerprint(), fingerprint)
+
+
+class ImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'user{n}', password='!') for n in range(3)])
+        tags = [Tag.objects.create(name=name) for name in ('python', 'django', 'sql')]
+        for n in range(6):
+            question = Question.objects.create(author=users[n % 3], title=f'Question {n}', text='text', rating=n)
+            question.tags.set(tags[n % 2:n % 2 + 2])
+            Answer.objects.create(question=question, author=users[(n + 1) % 3], text='answer')
+            QuestionLike.objects.create(user=users[(n + 2) % 3], question=question, value=1)
+        AnswerLike.objects.create(user=users[0], answer=Answer.objects.first(), value=-1)
+
+    def snapshot(self):
+        # hot_score depends on the time it is computed at.
+        return {
+            model: list(model.objects.order_by('pk').values(*(
+                field.attname for field in model._meta.concrete_fields if field.attname != 'hot_score'
+            )))
+            for model in (User, Tag, Question, Question.tags.through, Answer, QuestionLike, AnswerLike)
+        }
+
+    def test_round_trip(self):
+        reputation.recount(User.objects.all())
+        for _ in related.rebuild():
+            pass
+        feeds.rebuild()
+        before = self.snapshot()
+        related_before = sorted(RelatedQuestion.objects.values_list('question_id', 'related_id', 'score'))
+        feeds_before = sorted(TagFeed.objects.values_list('tag_id', 'question_id', 'created_at'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_qa', directory, '--chunk-size', '4', stdout=StringIO())
+            User.objects.all().delete()
+            Tag.objects.all().delete()
+            self.assertFalse(RelatedQuestion.objects.exists() or TagFeed.objects.exists())
+            # The SQLite schema editor refuses to drop indexes inside the test's transaction.
+            call_command('import_qa', directory, '--batch-size', '5', '--keep-indexes', stdout=StringIO())
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(Question.objects.filter(hot_score=0).exists())
+        self.assertTrue(related_before)
+        self.assertEqual(sorted(RelatedQuestion.objects.values_list('question_id', 'related_id', 'score')), related_before)
+        self.assertEqual(sorted(TagFeed.objects.values_list('tag_id', 'question_id', 'created_at')), feeds_before)
+
+
+class ReputationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.asker = User.objects.create_user('asker', password='pw')
+        cls.answerer = User.objects.create_user('answerer', password='pw')
+        cls.voter = User.objects.create_user('voter', password='pw')
+        cls.question = Question.objects.create(author=cls.asker, title='Question', text='text')
+        cls.answer = Answer.objects.create(author=cls.answerer, question=cls.question, text='answer')
+
+    def setUp(self):
+        cache.clear()
+
+    def verify(self):
+        call_command('rebuild_reputation', verify=True, batch_size=2, stdout=StringIO())
+
+    def user(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def test_counters_follow_votes_acceptance_and_deletes(self):
+        self.verify()
+        votes.vote_question(self.voter, self.question.id, 1)
+        votes.vote_answer(self.voter, self.answer.id, 1)
+        self.verify()
+        self.assertEqual(self.user(self.asker).reputation, reputation.QUESTION_VOTE)
+
+        answer = Answer.objects.get(pk=self.answer.pk)
+        answer.is_correct = True
+        answer.save()
+        self.verify()
+        answerer = self.user(self.answerer)
+        self.assertEqual(answerer.reputation, reputation.ANSWER_VOTE + reputation.ACCEPTED)
+        self.assertEqual(answerer.accepted_count, 1)
+
+        votes.vote_answer(self.voter, self.answer.id, 1)
+        self.verify()
+        Answer.objects.get(pk=self.answer.pk).delete()
+        self.verify()
+        answerer = self.user(self.answerer)
+        self.assertEqual((answerer.reputation, answerer.answer_count, answerer.accepted_count), (0, 0, 0))
+
+        Question.objects.get(pk=self.question.pk).delete()
+        self.verify()
+        asker = self.user(self.asker)
+        self.assertEqual((asker.reputation, asker.question_count, asker.votes_received), (0, 0, 0))
+
+    def test_verify_reports_and_rebuild_repairs_drift(self):
+        votes.vote_question(self.voter, self.question.id, 1)
+        User.objects.filter(pk=self.asker.pk).update(reputation=100, question_count=7)
+        with self.assertRaisesMessage(CommandError, '1 users have wrong counters.'):
+            self.verify()
+        call_command('rebuild_reputation', stdout=StringIO())
+        self.verify()
+        asker = self.user(self.asker)
+        self.assertEqual((asker.reputation, asker.question_count), (reputation.QUESTION_VOTE, 1))
+
+
+class SidebarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'user{n}', reputation=n * 10) for n in range(20)])
+
+    def setUp(self):
+        cache.clear()
+
+    def change(self, user, delta):
+        User.objects.filter(pk=user.pk).update(reputation=F('reputation') + delta)
+        sidebar.member_changed(user.pk, delta)
+
+    def expected(self):
+        return sidebar._build_members()['items'][:sidebar.MEMBERS_LIMIT]
+
+    def test_deltas_update_the_cached_ranking(self):
+        sidebar.best_members()
+        self.change(self.users[3], 500)
+        self.change(self.users[19], -45)
+        self.change(self.users[18], 1)
+        # Served from the cache, and the same as a fresh ranking.
+        with self.assertNumQueries(0):
+            members = sidebar.best_members()
+        self.assertEqual(members, self.expected())
+        self.assertEqual(members[0]['id'], self.users[3].pk)
+
+    def test_contended_update_makes_the_next_read_rebuild(self):
+        sidebar.best_members()
+        stale = cache.get(sidebar.MEMBERS_KEY)
+        cache.add(f'{sidebar.MEMBERS_KEY}:lock', 'holder', sidebar.LOCK_TIMEOUT)
+        with mock.patch.object(sidebar, 'LOCK_WAIT', 0.02):
+            self.change(self.users[0], 1000)
+        # The lock holder finishes after the timed-out update gave up.
+        cache.set(sidebar.MEMBERS_KEY, stale)
+        cache.delete(f'{sidebar.MEMBERS_KEY}:lock')
+        members = sidebar.best_members()
+        self.assertEqual(members, self.expected())
+        self.assertEqual(members[0]['id'], self.users[0].pk)
+        with self.assertNumQueries(0):
+            sidebar.best_members()
+
+    def test_votes_reach_the_ranking_on_commit(self):
+        top = self.users[19]
+        question = Question.objects.create(author=top, title='Question', text='text')
+        sidebar.best_members()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                votes.vote_question(self.users[0], question.id, 1)
+                raise ValueError('rolled back')
+        self.assertEqual(sidebar.best_members()[0], {'id': top.pk, 'username': top.username, 'count': 190})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            votes.vote_question(self.users[0], question.id, 1)
+        self.assertEqual(sidebar.best_members()[0]['count'], 190)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sidebar.best_members()[0]['count'], 190 + reputation.QUESTION_VOTE)
+        self.assertEqual(sidebar.best_members(), self.expected())
+
+
+class AnswerCountTests(TestCase):
+    def verify(self):
+        call_command('rebuild_answer_counts', verify=True, batch_size=2, stdout=StringIO())
+
+    def test_counts_stay_consistent_after_creates_and_deletes(self):
+        author = User.objects.create_user('author', password='pw')
+        questions = [Question.objects.create(author=author, title=f'Question {n}', text='text') for n in range(3)]
+        answers = [Answer.objects.create(author=author, question=questions[n % 2], text='answer') for n in range(5)]
+        self.verify()
+        self.assertEqual([question.answer_count for question in Question.objects.order_by('id')], [3, 2, 0])
+        answers[0].delete()
+        Answer.objects.filter(question=questions[1]).delete()
+        self.verify()
+        self.assertEqual([question.answer_count for question in Question.objects.order_by('id')], [2, 0, 0])
+
+    def test_failed_counter_update_rolls_back_the_answer(self):
+        author = User.objects.create_user('author', password='pw')
+        question = Question.objects.create(author=author, title='Question', text='text')
+        with mock.patch.object(reputation, 'answer_created', side_effect=RuntimeError('counter update failed')):
+            with self.assertRaises(RuntimeError):
+                Answer.objects.create(author=author, question=question, text='answer')
+        self.assertFalse(Answer.objects.exists())
+        self.verify()
+
+
+class TagFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.voter = User.objects.create_user('voter', password='pw')
+        cls.python, cls.django = Tag.objects.create(name='python'), Tag.objects.create(name='django')
+        now = timezone.now()
+        cls.questions = []
+        for number in range(6):
+            question = Question.objects.create(author=cls.author, title=f'Question {number}', text='text')
+            # Two share a timestamp, so the id breaks the tie.
+            Question.objects.filter(pk=question.pk).update(created_at=now - timedelta(minutes=number // 2 * 2))
+            cls.questions.append(question)
+
+    def setUp(self):
+        cache.clear()
+
+    def feed_page(self, tag):
+        paginator = KeysetPaginator(TagFeed.objects.filter(tag=tag), TagFeed.ORDERING, 50, f'feed-test:{tag.pk}',
+                                    feeds.hydrate)
+        return [(row.id, row.rating) for row in paginator.page()]
+
+    def direct(self, tag):
+        questions = Question.objects.filter(tags=tag).order_by(*Question.NEW_ORDERING)
+        return list(questions.values_list('id', 'rating'))
+
+    def assertFeedsMatch(self):
+        for tag in (self.python, self.django):
+            self.assertEqual(self.feed_page(tag), self.direct(tag))
+
+    def test_feed_follows_tag_links_deletes_and_votes(self):
+        first, second, third = self.questions[:3]
+        for question in self.questions:
+            question.tags.add(self.python)
+        self.django.question_set.add(first, second, third)
+        self.assertFeedsMatch()
+        self.assertEqual(len(self.feed_page(self.python)), 6)
+
+        first.tags.remove(self.python)
+        self.django.question_set.remove(second)
+        self.assertFeedsMatch()
+
+        third.tags.clear()
+        self.assertFeedsMatch()
+
+        Question.objects.get(pk=self.questions[4].pk).delete()
+        self.assertFeedsMatch()
+
+        votes.vote_question(self.voter, self.questions[5].id, 1)
+        self.assertFeedsMatch()
+        self.assertIn((self.questions[5].id, 1), self.feed_page(self.python))
+
+    def test_rebuild_matches_the_links(self):
+        for question in self.questions:
+            question.tags.add(self.python if question.pk % 2 else self.django)
+        TagFeed.objects.all().delete()
+        feeds.rebuild()
+        self.assertFeedsMatch()
+        # Rebuilding from an id keeps the rows below it.
+        feeds.rebuild(from_question_id=self.questions[2].pk)
+        self.assertFeedsMatch()
+
+
+class ListingRowTests(TestCase):
+    def test_tag_names(self):
+        author = User.objects.create_user('author', password='pw')
+        untagged = Question.objects.create(author=author, title='Untagged', text='text')
+        tagged = Question.objects.create(author=author, title='Tagged', text='text')
+        tagged.tags.add(Tag.objects.create(name='python'), Tag.objects.create(name='django'))
+        rows = {row.id: row for row in listing.load([untagged.id, tagged.id])}
+        self.assertEqual(rows[untagged.id].tag_names, [])
+        self.assertEqual(sorted(rows[tagged.id].tag_names), ['django', 'python'])
+        self.assertNotContains(self.client.get('/'), '/tag/None/')
+
+
+class TagSuggestTests(TestCase):
+    def setUp(self):
+        self.index = suggest.TagPrefixIndex()
+        patcher = mock.patch.object(suggest, 'tag_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_snapshot_matches_brute_force(self):
+        rng = random.Random(7)
+        names = set()
+        while len(names) < 2000:
+            # A small alphabet, so many prefixes cover more than SCAN_LIMIT names.
+            name = ''.join(rng.choice('abcAB-') for _ in range(rng.randint(3, 8)))
+            names.add(name)
+        rows = [(tag_id, name, rng.randint(0, 20)) for tag_id, name in enumerate(sorted(names), 1)]
+        snapshot = suggest.Snapshot(rows)
+        self.assertTrue(any(len(best) == suggest.LIMIT for best in snapshot.top.values()))
+
+        ordered = sorted((name.lower(), name, count, tag_id) for tag_id, name, count in rows)
+        prefixes = {key[:length] for key, *_ in ordered for length in range(1, len(key) + 1)}
+        for prefix in sorted(prefixes) + ['abcabcab', 'z', 'b-z']:
+            matches = [(name, count) for key, name, count, _ in ordered if key.startswith(prefix)]
+            expected = sorted(matches, key=lambda tag: -tag[1])[:suggest.LIMIT]
+            self.assertEqual(snapshot.suggest(prefix), expected, prefix)
+
+    def test_new_tags_are_suggested(self):
+        question = Question.objects.create(author=User.objects.create_user('author', password='pw'), title='Q', text='text')
+        question.tags.add(Tag.objects.create(name='Python'))
+        self.assertEqual(suggest.suggest_tags('PY'), [('Python', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='pyramid')
+        self.assertEqual(suggest.suggest_tags('py'), [('Python', 1), ('pyramid', 0)])
+
+        # Created elsewhere: found by the periodic check for newer ids.
+        Tag.objects.bulk_create([Tag(name='pytest')])
+        self.assertEqual(suggest.suggest_tags('pyte'), [])
+        self.index.checked_at = 0
+        self.assertEqual(suggest.suggest_tags('pyte'), [('pytest', 0)])
+
+        with mock.patch.object(suggest, 'REBUILD_RECENT', 1), \
+                mock.patch.object(self.index, '_rebuild_in_background') as rebuild:
+            self.index.add([(Tag.objects.create(name='pylint').id, 'pylint')])
+        rebuild.assert_called_once_with()
+        self.index.build()
+        self.assertEqual(self.index.recent, [])
+        self.assertEqual(suggest.suggest_tags('py', limit=3), [('Python', 1), ('pylint', 0), ('pyramid', 0)])
+
+    def test_view(self):
+        Tag.objects.bulk_create([Tag(name='Django'), Tag(name='django-rest'), Tag(name='sql')])
+        response = self.client.get('/tags/suggest/', {'q': ' DJ '})
+        self.assertEqual(response.json(), {'tags': [{'name': 'Django', 'count': 0}, {'name': 'django-rest', 'count': 0}]})
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(self.client.get('/tags/suggest/').json(), {'tags': []})
+
+
+class LiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.question = Question.objects.create(author=cls.author, title='Question', text='text', rating=3)
+        cls.answers = [Answer.objects.create(question=cls.question, author=cls.author, text=f'answer {n}') for n in range(3)]
+
+    def test_poller_reports_changes_since_last_poll(self):
+        other = Question.objects.create(author=self.author, title='Other', text='text')
+        poller = live.Poller()
+        watched = {self.question.id, other.id}
+        self.assertEqual(poller.changes(watched), [])
+
+        Question.objects.filter(pk=self.question.pk).update(rating=4)
+        Answer.objects.filter(pk=self.answers[0].pk).update(rating=1)
+        answer = Answer.objects.create(question=other, author=self.author, text='new')
+        self.assertEqual(sorted(poller.changes(watched)), sorted([
+            ('question_rating', self.question.id, self.question.id),
+            ('answer_rating', self.question.id, self.answers[0].id),
+            ('answer', other.id, answer.id),
+        ]))
+        self.assertEqual(poller.changes(watched), [])
+
+        # A question nobody watches any more is forgotten, and its next first
+        # poll only records where it stands again.
+        poller.changes({self.question.id})
+        self.assertNotIn(other.id, poller.answers)
+        Answer.objects.create(question=other, author=self.author, text='unseen')
+        self.assertEqual(poller.changes(watched), [])
+
+    def test_catch_up(self):
+        rating = live._message('rating', {'question': self.question.id, 'rating': 3})
+        self.assertEqual(live.catch_up(self.question.id, None), [rating])
+        messages = live.catch_up(self.question.id, self.answers[0].id)
+        self.assertEqual(messages[0], rating)
+        self.assertEqual([message.split(b'\n')[1] for message in messages[1:]],
+                         [f'id: {answer.id}'.encode() for answer in self.answers[1:]])
+        with mock.patch.object(live, 'CATCH_UP_LIMIT', 1):
+            messages = live.catch_up(self.question.id, 0)
+        self.assertEqual(messages[1].split(b'\n')[1], f'id: {self.answers[2].id}'.encode())
+
+    async def test_stream_resumes_after_last_event_id(self):
+        factory = RequestFactory()
+        url = f'/question/{self.question.id}/events/'
+        with mock.patch.object(live, '_events', return_value=iter(())) as events:
+            await live.question_events(factory.get(url, {'after': '5'}, HTTP_LAST_EVENT_ID='7'), self.question.id)
+            await live.question_events(factory.get(url, {'after': '9'}, HTTP_LAST_EVENT_ID='x'), self.question.id)
+            # Only the first page asks for new answers.
+            await live.question_events(factory.get(url, HTTP_LAST_EVENT_ID='7'), self.question.id)
+        self.assertEqual([call.args for call in events.call_args_list],
+                         [(self.question.id, 7), (self.question.id, 9), (self.question.id, None)])
+
+    async def test_full_queue_ends_stream(self):
+        broker = live.Broker()
+        with mock.patch.object(live.Broker, 'run', lambda self: asyncio.sleep(0)), \
+                mock.patch.object(live, 'FLUSH_DELAY', 0), \
+                mock.patch.object(live, 'load_messages', return_value=[(1, b'new')]):
+            stalled, reading = broker.subscribe(1), broker.subscribe(1)
+            for n in range(live.QUEUE_SIZE):
+                stalled.put_nowait(b'old')
+            broker.notify([('answer', 1, 1)])
+            await broker.flushing
+        self.assertEqual(broker.watchers[1], {reading})
+        self.assertEqual(reading.get_nowait(), b'new')
+        messages = [stalled.get_nowait() for _ in range(live.QUEUE_SIZE)]
+        self.assertEqual(messages[-1], None)
+
+    async def test_keepalive(self):
+        with mock.patch.object(live, 'broker', live.Broker()), \
+                mock.patch.object(live.Broker, 'run', lambda self: asyncio.sleep(0)), \
+                mock.patch.object(live, 'catch_up', return_value=[]), \
+                mock.patch.object(live, 'KEEPALIVE_SECONDS', 0.02), \
+                mock.patch.object(live, 'STREAM_SECONDS', 0.1):
+            messages = [message async for message in live._events(self.question.id, None)]
+            self.assertEqual(live.broker.watchers, {})
+        self.assertEqual(messages[0], f'retry: {live.RETRY_MS}\n\n'.encode())
+        self.assertGreaterEqual(messages.count(b': keepalive\n\n'), 3)
+
+
+class LiveStreamTests(TransactionTestCase):
+    # The poller reads in its own threads, which only see committed rows.
+    databases = {'default', 'replica'}
+
+    async def test_poller_delivers_each_change_once(self):
+        author = await User.objects.acreate(username='author', password='!')
+        question = await Question.objects.acreate(author=author, title='Question', text='text')
+        with mock.patch.object(live, 'broker', live.Broker()), \
+                mock.patch.object(live, 'POLL_SECONDS', 0.02), \
+                mock.patch.object(live, 'FLUSH_DELAY', 0.01), \
+                mock.patch.object(live, 'STREAM_SECONDS', 0.5):
+            stream = live._events(question.id, 0)
+            messages = [await anext(stream), await anext(stream)]
+            # Past the poller's first look at the question.
+            await asyncio.sleep(0.1)
+            await Question.objects.filter(pk=question.pk).aupdate(rating=2)
+            answer = await sync_to_async(Answer.objects.create)(question=question, author=author, text='new')
+            messages += [message async for message in stream]
+            live.broker.source.cancel()
+
+        events = [message.split(b'\n')[0] for message in messages[1:]]
+        self.assertEqual(events.count(b'event: rating'), 2)
+        self.assertEqual(events.count(b'event: answer'), 1)
+        self.assertIn(live._message('rating', {'question': question.id, 'rating': 2}), messages)
+        self.assertIn(f'id: {answer.id}'.encode(), [message.split(b'\n')[1] for message in messages])
@@ -5,10 +5,18 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('hot/', views.hot, name='hot'),
     path('tag/<str:tag_name>/', views.tag, name='tag'),
+    path('search/', views.search, name='search'),
+    path('tags/suggest/', views.suggest_tags, name='suggest_tags'),
     path('question/<int:question_id>/', views.question, name='question'),
+    path('question/<int:question_id>/vote/', views.vote_question, name='vote_question'),
+    path('answer/<int:answer_id>/vote/', views.vote_answer, name='vote_answer'),
+    path('user/<int:user_id>/', views.user_profile, name='user_profile'),
+    path('user/<int:user_id>/answers/', views.user_profile, {'activity': 'answers'}, name='user_answers'),
     path('login/', views.login, name='login'),
     path('signup/', views.signup, name='signup'),
     path('ask/', views.ask, name='ask'),
     path('settings/', views.settings, name='settings'),
-    path('logout/', views.logout, name='logout')
+    path('logout/', views.logout, name='logout'),
+    path('internal/profile/', views.profile_stats, name='profile_stats'),
+    path('internal/jobs/', views.job_stats, name='job_stats'),
 ]
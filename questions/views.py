@@ -1,27 +1,31 @@
+import hashlib
+from urllib.parse import urlencode
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Count
-from .models import Question, Answer, Tag, User
+from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
+from django.views.static import serve
+from django.utils.cache import patch_cache_control
+from django.conf import settings as _settings
+from django.db.models.functions import Substr
+from .models import User, Question, Answer, Tag, TagFeed
 from django.contrib.auth import logout as _logout
+from .sidebar import get_sidebar
+from .pagination import KeysetPaginator
+from .caching import (
+    cache_anonymous_page, conditional_page, hot_fingerprint, hot_version, pages_fingerprint, question_fingerprint,
+)
+from . import caching, votes, profiling, feeds, listing, jobs, avatars, suggest, related, search as question_search
 
 def get_global_context(request):
-    return {
-        'popular_tags': Tag.objects.popular(),
-        'best_members': User.objects.best(),
-    }
+    return dict(get_sidebar(request))
 
-def paginate(objects_list, request, per_page=10):
-    paginator = Paginator(objects_list, per_page)
-    page_number = request.GET.get('page')
-    try:
-        page = paginator.page(page_number)
-    except PageNotAnInteger:
-        page = paginator.page(1)
-    except EmptyPage:
-        page = paginator.page(paginator.num_pages)
+def paginate(objects_list, request, ordering, count_key, per_page=10, hydrate=None, count=None):
+    paginator = KeysetPaginator(objects_list, ordering, per_page, count_key, hydrate, count)
+    page = paginator.page(request.GET.get('page'), request.GET.get('cursor'))
     text_range = []
-    active_pages = {1, paginator.num_pages, page.number, page.number - 1, page.number + 1}
-    pages = sorted(list(page for page in active_pages if 0 < page <= paginator.num_pages))
+    active_pages = {1, page.num_pages, page.number, page.number - 1, page.number + 1}
+    pages = sorted(list(p for p in active_pages if 0 < p <= page.num_pages))
     prev = 0
     for p in pages:
         if prev > 0:
@@ -33,9 +37,10 @@ def paginate(objects_list, request, per_page=10):
         prev = p
     return page, text_range
 
+@conditional_page(pages_fingerprint)
+@cache_anonymous_page
 def index(request):
-    questions = Question.objects.new()
-    page, page_range = paginate(questions, request, per_page=10)
+    page, page_range = paginate_questions(request, Question.NEW_ORDERING)
     context = {
         'page': page, 
         'title': 'New Questions', 
@@ -44,9 +49,10 @@ def index(request):
     context.update(get_global_context(request))
     return render(request, 'pages/index.html', context)
 
+@conditional_page(hot_fingerprint)
+@cache_anonymous_page(version=hot_version)
 def hot(request):
-    questions = Question.objects.hot()
-    page, page_range = paginate(questions, request, per_page=10)
+    page, page_range = paginate_questions(request, Question.HOT_ORDERING)
     context = {
         'page': page, 
         'title': 'Hot Questions', 
@@ -55,14 +61,25 @@ def hot(request):
     context.update(get_global_context(request))
     return render(request, 'pages/index.html', context)
 
+def paginate_questions(request, ordering):
+    # Pages over just the ordering columns, then loads slim rows for the page.
+    questions = listing.key_queryset(ordering)
+    page, page_range = paginate(questions, request, ordering, 'questions', per_page=10, hydrate=listing.hydrate)
+    caching.note_listed(request, page)
+    return page, page_range
+
+def paginate_tag(request, tag_id):
+    # Pages over the per-tag feed and loads just that page of questions.
+    feed = TagFeed.objects.filter(tag_id=tag_id)
+    page, page_range = paginate(feed, request, TagFeed.ORDERING, f'tag:{tag_id}', per_page=10, hydrate=feeds.hydrate)
+    caching.note_listed(request, page)
+    return page, page_range
+
+@conditional_page(pages_fingerprint)
+@cache_anonymous_page
 def tag(request, tag_name):
     tag_obj = get_object_or_404(Tag, name=tag_name)
-    questions = Question.objects.filter(tags=tag_obj)\
-        .select_related('author')\
-        .prefetch_related('tags')\
-        .annotate(num_answers=Count('answer'))\
-        .order_by('-created_at')
-    page, page_range = paginate(questions, request, per_page=10)
+    page, page_range = paginate_tag(request, tag_obj.pk)
     context = {
         'page': page, 
         'tag_name': tag_name, 
@@ -71,23 +88,72 @@ def tag(request, tag_name):
     context.update(get_global_context(request))
     return render(request, 'pages/index.html', context)
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    questions, capped = question_search.search_questions(query)
+    # Versioned, so a reindex drops the cached counts.
+    count_key = f'search:{caching.search_version()}:' + hashlib.md5(query.encode()).hexdigest()
+    page, page_range = paginate(questions, request, question_search.ORDERING, count_key, per_page=10,
+                                hydrate=listing.hydrate)
+    context = {
+        'page': page,
+        'query': query,
+        'page_range': page_range,
+        'page_query': urlencode({'q': query}) + '&',
+        'result_limit': question_search.FALLBACK_LIMIT if capped else None,
+    }
+    context.update(get_global_context(request))
+    return render(request, 'pages/search.html', context)
+
+def suggest_tags(request):
+    tags = suggest.suggest_tags(request.GET.get('q', ''))
+    response = JsonResponse({'tags': [{'name': name, 'count': count} for name, count in tags]})
+    # The same for everyone; lets the browser reuse it while the user retypes.
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+@conditional_page(question_fingerprint)
 def question(request, question_id):
     question_item = get_object_or_404(
         Question.objects.select_related('author').prefetch_related('tags'), 
         pk=question_id
     )
     answers = Answer.objects.filter(question=question_item)\
-        .select_related('author')\
-        .order_by('-created_at')
-    page, page_range = paginate(answers, request, per_page=5)
+        .select_related('author')
+    page, page_range = paginate(answers, request, Answer.ORDERING, f'answers:{question_item.pk}', per_page=5)
     context = {
         'question': question_item, 
         'answers': page, 
-        'page_range': page_range
+        'page_range': page_range,
+        'related': related.for_question(question_item.pk),
     }
     context.update(get_global_context(request))
     return render(request, 'pages/question.html', context)
 
+def user_profile(request, user_id, activity='questions'):
+    # Totals come from the counters on the user row, so the page runs no
+    # aggregate; the lists seek through the author indexes.
+    profile = get_object_or_404(User, pk=user_id)
+    if activity == 'answers':
+        answers = Answer.objects.filter(author_id=user_id)\
+            .select_related('question')\
+            .only('id', 'created_at', 'rating', 'is_correct', 'question', 'question__title')\
+            .annotate(excerpt=Substr('text', 1, listing.EXCERPT_LENGTH))
+        page, page_range = paginate(answers, request, Answer.ORDERING, f'user_answers:{user_id}',
+                                    count=profile.answer_count)
+    else:
+        questions = listing.key_queryset(Question.NEW_ORDERING).filter(author_id=user_id)
+        page, page_range = paginate(questions, request, Question.NEW_ORDERING, f'user_questions:{user_id}',
+                                    hydrate=listing.hydrate, count=profile.question_count)
+    context = {
+        'profile': profile,
+        'activity': activity,
+        'page': page,
+        'page_range': page_range,
+    }
+    context.update(get_global_context(request))
+    return render(request, 'pages/user.html', context)
+
 def login(request):
     context = get_global_context(request)
     return render(request, 'pages/login.html', context)
@@ -107,3 +173,38 @@ def settings(request):
 def logout(request):
     _logout(request)
     return redirect('index')
+
+def _vote(request, vote, model, object_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Log in to vote.'}, status=401)
+    get_object_or_404(model, pk=object_id)
+    try:
+        rating, value = vote(request.user, object_id, int(request.POST.get('value', '')))
+    except ValueError:
+        return JsonResponse({'error': 'Vote value must be 1 or -1.'}, status=400)
+    return JsonResponse({'rating': rating, 'vote': value})
+
+@require_POST
+def vote_question(request, question_id):
+    return _vote(request, votes.vote_question, Question, question_id)
+
+@require_POST
+def vote_answer(request, answer_id):
+    return _vote(request, votes.vote_answer, Answer, answer_id)
+
+@staff_member_required
+def profile_stats(request):
+    if request.GET.get('reset'):
+        profiling.histograms.reset()
+    return JsonResponse(profiling.histograms.snapshot())
+
+@staff_member_required
+def job_stats(request):
+    return JsonResponse(jobs.queue_stats())
+
+def media(request, path):
+    response = serve(request, path, document_root=_settings.MEDIA_ROOT)
+    if path.startswith(avatars.THUMBNAIL_DIR + '/'):
+        # Thumbnail names are content hashes; a new avatar gets a new URL.
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,52 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Question, Answer, QuestionLike, AnswerLike
+from . import reputation
+
+VOTE_VALUES = (1, -1)
+# Inserts retried when the like row vanishes between the failed insert and
+# the lookup (deleted with its user, or by an admin).
+ATTEMPTS = 3
+
+
+def _record(like_model, lookup, value):
+    # Returns (rating delta, the user's vote now).
+    for attempt in range(ATTEMPTS):
+        try:
+            with transaction.atomic():
+                like_model.objects.create(value=value, **lookup)
+            return value, value
+        except IntegrityError:
+            if attempt == ATTEMPTS - 1:
+                raise
+        # Only this user's like row is locked; the target row is locked
+        # by the F() update in _vote for the rest of the (short) transaction.
+        like = like_model.objects.select_for_update().filter(**lookup).first()
+        if like is not None:
+            break
+    # Voting the same way again withdraws the vote.
+    new_value = 0 if like.value == value else value
+    delta = new_value - like.value
+    like.value = new_value
+    like.save(update_fields=['value', 'updated_at'])
+    return delta, new_value
+
+
+def _vote(like_model, target_model, target_field, points, user, target_id, value):
+    if value not in VOTE_VALUES:
+        raise ValueError(f'Unsupported vote value: {value}')
+    lookup = {'user': user, f'{target_field}_id': target_id}
+    with transaction.atomic():
+        delta, value = _record(like_model, lookup, value)
+        target_model.objects.filter(pk=target_id).update(rating=F('rating') + delta)
+        rating, author_id = target_model.objects.values_list('rating', 'author_id').get(pk=target_id)
+        reputation.vote_received(author_id, points, delta)
+    return rating, value
+
+
+def vote_question(user, question_id, value):
+    return _vote(QuestionLike, Question, 'question', reputation.QUESTION_VOTE, user, question_id, value)
+
+
+def vote_answer(user, answer_id, value):
+    return _vote(AnswerLike, Answer, 'answer', reputation.ANSWER_VOTE, user, answer_id, value)